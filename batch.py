@@ -0,0 +1,73 @@
+import argparse
+import json
+import multiprocessing
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from mazefile import generate_maze, random_seed, save_maze
+
+
+def produce(path, width, height, threshold, seed, packed, parallel):
+    start = perf_counter()
+    maze, generator = generate_maze(width, height, threshold, seed, packed, parallel)
+    seconds = perf_counter() - start
+
+    save_maze(path, maze, threshold, seed, generator)
+
+    return {
+        "path": os.path.basename(path),
+        "seed": seed,
+        "width": width,
+        "height": height,
+        "seconds": seconds,
+        "bytes": os.path.getsize(path),
+    }
+
+
+def produce_batch(output, count, width, height, threshold, seed, packed=False, parallel=False, workers=None):
+    os.makedirs(output, exist_ok=True)
+
+    with ProcessPoolExecutor(workers, multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(produce, os.path.join(output, f"maze_{i:05d}.maze"), width, height, threshold, seed + i, packed, parallel)
+            for i in range(count)
+        ]
+        entries = [future.result() for future in futures]
+
+    manifest = {
+        "count": count,
+        "width": width,
+        "height": height,
+        "threshold": threshold,
+        "seed": seed,
+        "packed": packed,
+        "parallel": parallel,
+        "mazes": entries,
+    }
+    with open(os.path.join(output, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a batch of seeded mazes into a directory with a manifest")
+    parser.add_argument("output", help="the directory to write the mazes and manifest.json to")
+    parser.add_argument("count", type=int)
+    parser.add_argument("width", type=int)
+    parser.add_argument("height", type=int, nargs="?")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, help="maze i uses seed + i, random by default")
+    parser.add_argument("--workers", type=int, help="worker processes, one per CPU by default")
+    parser.add_argument("--packed", action="store_true")
+    parser.add_argument("--parallel", action="store_true")
+    args = parser.parse_args()
+
+    seed = random_seed() if args.seed is None else args.seed
+    start = perf_counter()
+    manifest = produce_batch(args.output, args.count, args.width, args.height or args.width, args.threshold, seed, args.packed, args.parallel, args.workers)
+
+    total = sum(entry["bytes"] for entry in manifest["mazes"])
+    print(f"wrote {args.count} mazes ({total / (1 << 20):.1f} MB) to {args.output} in {perf_counter() - start:.2f}s")
@@ -0,0 +1,201 @@
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+
+import numba
+import numpy as np
+
+from time import perf_counter
+
+from generator import create_maze
+from solver import solve_maze, build_index
+from renderer import build_pyramid, classify, index_path, render
+
+
+SIZES = (100, 500, 1000, 1500, 2000)
+THRESHOLDS = (0.25,)
+VIEWPORTS = ("1024x768", "1920x1080")
+ZOOMS = (0.5, 3, 10, 40)
+PERCENTILES = (50, 90, 99)
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / (1 << 20)
+    finally:
+        tracemalloc.stop()
+
+
+def measure(name, params, fn, repeat):
+    start = perf_counter()
+    fn()
+    warmup = perf_counter() - start
+
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = perf_counter()
+        fn()
+        times[i] = perf_counter() - start
+
+    return timed(name, params, warmup, times, peak_memory(fn))
+
+
+def timed(name, params, warmup, times, peak):
+    key = "/".join([name] + [f"{k}={v}" for k, v in params.items()])
+    stats = {"min": times.min(), "mean": times.mean(), "max": times.max()}
+    for p in PERCENTILES:
+        stats[f"p{p}"] = np.percentile(times, p)
+
+    result = {
+        "key": key,
+        "name": name,
+        "params": params,
+        "warmup": warmup,
+        "runs": len(times),
+        "stats": {k: float(v) for k, v in stats.items()},
+        "peak_mb": peak,
+    }
+    print(f"{key:<52}{warmup * 1e3:>11.2f}" + "".join(f"{result['stats'][f'p{p}'] * 1e3:>11.2f}" for p in PERCENTILES) + f"{peak:>10.1f}")
+
+    return result
+
+
+def random_queries(maze, count, rng):
+    xs, ys = np.nonzero(maze)
+    picks = rng.integers(0, len(xs), (count, 2))
+    return [((xs[a] + 0.5, ys[a] + 0.5), (xs[b] + 0.5, ys[b] + 0.5)) for a, b in picks]
+
+
+def bench_generate(args):
+    for size in args.sizes:
+        for threshold in args.thresholds:
+            yield measure("generate", {"size": size, "threshold": threshold}, lambda: create_maze(size, size, threshold, args.seed), args.repeat)
+
+
+def bench_solve(args):
+    for size in args.sizes:
+        maze = create_maze(size, size, args.thresholds[0], args.seed)
+        index = build_index(maze)
+
+        w, h = maze.shape
+        corners = ((0.5, 0.5), (w - 0.5, h - 0.5))
+        queries = random_queries(maze, args.queries, np.random.default_rng(args.seed))
+
+        for mode, solver_index in (("bfs", None), ("index", index)):
+            params = {"size": size, "mode": mode}
+            yield measure("solve-corner", params, lambda: solve_maze(maze, *corners, solver_index), args.repeat)
+
+            start = perf_counter()
+            solve_maze(maze, *queries[0], solver_index)
+            warmup = perf_counter() - start
+
+            def solve_random():
+                for a, b in queries:
+                    solve_maze(maze, a, b, solver_index)
+
+            times = np.empty(len(queries))
+            for i, (a, b) in enumerate(queries):
+                start = perf_counter()
+                solve_maze(maze, a, b, solver_index)
+                times[i] = perf_counter() - start
+
+            yield timed("solve-random", params, warmup, times, peak_memory(solve_random))
+
+
+def bench_render(args):
+    for size in args.sizes:
+        maze = create_maze(size, size, args.thresholds[0], args.seed)
+        table = classify(maze)
+        pyramid = build_pyramid(maze)
+
+        w, h = maze.shape
+        start, end = (0.5, 0.5), (w - 0.5, h - 0.5)
+        _, path = solve_maze(maze, start, end, build_index(maze))
+        path_index = index_path(start, end, path)
+
+        for viewport in args.viewports:
+            view = tuple(int(v) for v in viewport.split("x"))
+            for zoom in args.zooms:
+                offset = (zoom * w / 2, zoom * h / 2)
+                params = {"size": size, "viewport": viewport, "zoom": zoom}
+                yield measure("render", params, lambda: render(table, view, offset, zoom, start, end, path_index, pyramid), args.repeat)
+
+
+BENCHMARKS = {
+    "generate": bench_generate,
+    "solve": bench_solve,
+    "render": bench_render,
+}
+
+
+def compare(results, baseline, tolerance):
+    previous = {r["key"]: r for r in baseline["results"]}
+    regressions = []
+
+    print(f"\n{'benchmark':<52}{'baseline':>11}{'current':>11}{'change':>9}")
+    for result in results:
+        old = previous.get(result["key"])
+        if old is None:
+            continue
+
+        before, after = old["stats"]["p50"], result["stats"]["p50"]
+        change = after / before - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(result["key"])
+            flag = "  REGRESSION"
+
+        print(f"{result['key']:<52}{before * 1e3:>11.2f}{after * 1e3:>11.2f}{change:>+9.1%}{flag}")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark maze generation, solving and rendering")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=THRESHOLDS)
+    parser.add_argument("--viewports", nargs="+", default=VIEWPORTS)
+    parser.add_argument("--zooms", type=float, nargs="+", default=ZOOMS)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --output")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed median slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    print(f"{'benchmark':<52}{'warmup ms':>11}" + "".join(f"{f'p{p} ms':>11}" for p in PERCENTILES) + f"{'peak MB':>10}")
+
+    results = []
+    for name in args.only:
+        results.extend(BENCHMARKS[name](args))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "numba": numba.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "threads": numba.config.NUMBA_NUM_THREADS,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}")
+            sys.exit(1)
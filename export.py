@@ -0,0 +1,294 @@
+import argparse
+import struct
+import zlib
+
+import numpy as np
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from numba import njit
+
+from generator import create_maze
+from mazefile import load_maze
+from renderer import build_pyramid, classify, index_path, render
+from renderer import COLOR_END, COLOR_OUTLINE, COLOR_PATH, COLOR_START, DOT_RADIUS, LINE_WIDTH
+from solver import solve_levels, solve_maze, uses_levels
+from util import is_walkable, maze_shape
+
+
+IMAGE_SIZE = 3200
+MARGIN = 1.5
+BAND_ROWS = 256
+QUEUED_BANDS = 2
+COMPRESSION = 6
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+TIFF_SHORT = 3
+TIFF_LONG = 4
+TIFF_LONG8 = 16
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)))
+
+
+class PngWriter:
+    def __init__(self, f, width, height, band_rows):
+        self.f = f
+        self.compressor = zlib.compressobj(COMPRESSION)
+
+        f.write(PNG_SIGNATURE)
+        f.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+
+
+    def write(self, band):
+        rows = np.zeros((band.shape[0], band.shape[1] * 3 + 1), dtype=np.uint8)
+        rows[:, 1:] = band.reshape(band.shape[0], -1)
+
+        data = self.compressor.compress(rows)
+        if data:
+            self.f.write(png_chunk(b"IDAT", data))
+
+
+    def close(self):
+        self.f.write(png_chunk(b"IDAT", self.compressor.flush()))
+        self.f.write(png_chunk(b"IEND", b""))
+
+
+class TiffWriter:
+    def __init__(self, f, width, height, band_rows):
+        self.f = f
+        self.width = width
+        self.height = height
+        self.band_rows = band_rows
+        self.offsets = []
+        self.counts = []
+
+        self.big = width * height * 3 + (height // band_rows + 1) * 16 + 1024 >= 1 << 32
+        if self.big:
+            f.write(b"II+\x00" + struct.pack("<HHQ", 8, 0, 0))
+        else:
+            f.write(b"II*\x00" + struct.pack("<I", 0))
+
+
+    def write(self, band):
+        self.offsets.append(self.f.tell())
+        self.counts.append(band.nbytes)
+        self.f.write(np.ascontiguousarray(band))
+
+
+    def close(self):
+        strip = TIFF_LONG8 if self.big else TIFF_LONG
+        entries = [
+            (256, TIFF_LONG, [self.width]),
+            (257, TIFF_LONG, [self.height]),
+            (258, TIFF_SHORT, [8, 8, 8]),
+            (259, TIFF_SHORT, [1]),
+            (262, TIFF_SHORT, [2]),
+            (273, strip, self.offsets),
+            (277, TIFF_SHORT, [3]),
+            (278, TIFF_LONG, [self.band_rows]),
+            (279, strip, self.counts),
+            (284, TIFF_SHORT, [1]),
+        ]
+        dtypes = {TIFF_SHORT: "<u2", TIFF_LONG: "<u4", TIFF_LONG8: "<u8"}
+        inline = 8 if self.big else 4
+
+        values = []
+        for tag, kind, data in entries:
+            data = np.array(data, dtype=dtypes[kind]).tobytes()
+            if len(data) > inline:
+                if self.f.tell() % 2:
+                    self.f.write(b"\x00")
+                offset = self.f.tell()
+                self.f.write(data)
+                data = struct.pack("<Q" if self.big else "<I", offset)
+            values.append(data.ljust(inline, b"\x00"))
+
+        if self.f.tell() % 2:
+            self.f.write(b"\x00")
+        ifd = self.f.tell()
+
+        if self.big:
+            self.f.write(struct.pack("<Q", len(entries)))
+            for (tag, kind, data), value in zip(entries, values):
+                self.f.write(struct.pack("<HHQ", tag, kind, len(data)) + value)
+            self.f.write(struct.pack("<Q", 0))
+            self.f.seek(8)
+            self.f.write(struct.pack("<Q", ifd))
+        else:
+            self.f.write(struct.pack("<H", len(entries)))
+            for (tag, kind, data), value in zip(entries, values):
+                self.f.write(struct.pack("<HHI", tag, kind, len(data)) + value)
+            self.f.write(struct.pack("<I", 0))
+            self.f.seek(4)
+            self.f.write(struct.pack("<I", ifd))
+
+
+WRITERS = {
+    ".png": PngWriter,
+    ".tif": TiffWriter,
+    ".tiff": TiffWriter,
+}
+
+
+def export(path, table, size, offset, scale, start, end, path_index, pyramid=None, band_rows=BAND_ROWS):
+    suffix = path[path.rfind("."):].lower()
+    assert suffix in WRITERS, f"Unsupported image format {suffix}"
+
+    w, h = size
+    top = round(offset[1] - h / 2)
+    band_rows += band_rows % 2
+
+    with open(path, "wb") as f, ThreadPoolExecutor(1) as encoder:
+        writer = WRITERS[suffix](f, w, h, band_rows)
+        pending = deque()
+
+        for y in range(0, h, band_rows):
+            rows = min(band_rows, h - y)
+            band = render(table, (w, rows), (offset[0], top + y + rows / 2), scale, start, end, path_index, pyramid)
+
+            pending.append(encoder.submit(writer.write, band))
+            while len(pending) > QUEUED_BANDS:
+                pending.popleft().result()
+
+        while pending:
+            pending.popleft().result()
+        writer.close()
+
+
+@njit(cache=True)
+def runs_array(runs):
+    out = np.empty((len(runs), 3), dtype=np.int64)
+    for i, run in enumerate(runs):
+        out[i] = run
+
+    return out
+
+
+@njit(cache=True)
+def wall_runs(maze):
+    width, height = maze_shape(maze)
+    h_start = np.full(height + 1, -1, dtype=np.int64)
+    h_runs = []
+    v_runs = []
+
+    for x in range(width + 1):
+        v_start = -1
+        for y in range(height + 1):
+            tile = is_walkable(maze, x, y)
+
+            v_edge = y < height and tile != is_walkable(maze, x - 1, y)
+            if v_edge and v_start < 0:
+                v_start = y
+            elif not v_edge and v_start >= 0:
+                v_runs.append((x, v_start, y))
+                v_start = -1
+
+            h_edge = x < width and tile != is_walkable(maze, x, y - 1)
+            if h_edge and h_start[y] < 0:
+                h_start[y] = x
+            elif not h_edge and h_start[y] >= 0:
+                h_runs.append((h_start[y], y, x))
+                h_start[y] = -1
+
+    return runs_array(h_runs), runs_array(v_runs)
+
+
+@njit(cache=True)
+def put_int(buf, pos, value):
+    digits = 1
+    while value >= 10 ** digits:
+        digits += 1
+
+    for k in range(digits):
+        buf[pos + digits - 1 - k] = ord("0") + value % 10
+        value //= 10
+
+    return pos + digits
+
+
+@njit(cache=True)
+def path_commands(runs, command):
+    digits = len(str(max(runs.max(), 1))) if runs.shape[0] > 0 else 1
+    buf = np.empty(runs.shape[0] * (3 * digits + 3), dtype=np.uint8)
+
+    pos = 0
+    for a, b, c in runs:
+        buf[pos] = ord("M")
+        pos = put_int(buf, pos + 1, a)
+        buf[pos] = ord(" ")
+        pos = put_int(buf, pos + 1, b)
+        buf[pos] = command
+        pos = put_int(buf, pos + 1, c)
+
+    return buf[:pos]
+
+
+def svg_color(color):
+    return "#" + "".join(f"{c:02x}" for c in color)
+
+
+def export_svg(path, maze, tile_size, start, end, solution):
+    maze_w, maze_h = maze_shape(maze)
+    h_runs, v_runs = wall_runs(maze)
+    points = np.vstack(([start], solution, [end]))
+
+    with open(path, "wb") as f:
+        write = lambda text: f.write(text.encode())
+        write(
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{tile_size * (maze_w + 2 * MARGIN):g}" height="{tile_size * (maze_h + 2 * MARGIN):g}" '
+            f'viewBox="{-MARGIN:g} {-MARGIN:g} {maze_w + 2 * MARGIN:g} {maze_h + 2 * MARGIN:g}">\n'
+            f'<rect x="{-MARGIN:g}" y="{-MARGIN:g}" width="100%" height="100%" fill="#ffffff"/>\n'
+            f'<path fill="none" stroke="{svg_color(COLOR_OUTLINE)}" stroke-width="{2 * LINE_WIDTH:g}" stroke-linecap="square" d="'
+        )
+        f.write(path_commands(h_runs, ord("H")))
+        f.write(path_commands(v_runs, ord("V")))
+        write('"/>\n')
+
+        write(f'<polyline fill="none" stroke="{svg_color(COLOR_PATH)}" stroke-width="{2 * LINE_WIDTH:g}" stroke-linejoin="round" points="')
+        write(" ".join(f"{x:g},{y:g}" for x, y in points.tolist()))
+        write('"/>\n')
+
+        for (x, y), color in ((start, COLOR_START), (end, COLOR_END)):
+            write(f'<circle cx="{x:g}" cy="{y:g}" r="{DOT_RADIUS:g}" fill="{svg_color(color)}"/>\n')
+        write("</svg>\n")
+
+
+def export_maze(path, maze, tile_size, band_rows=BAND_ROWS):
+    maze_w, maze_h = maze_shape(maze)
+    start = (0.5, 0.5)
+    end = (maze_w - 0.5, maze_h - 0.5)
+
+    _, solution = (solve_levels if uses_levels(maze) else solve_maze)(maze, start, end)
+    size = (round(tile_size * (maze_w + 2 * MARGIN)), round(tile_size * (maze_h + 2 * MARGIN)))
+    offset = (tile_size * maze_w / 2, tile_size * maze_h / 2)
+
+    if path.lower().endswith(".svg"):
+        export_svg(path, maze, tile_size, start, end, solution)
+    else:
+        export(path, classify(maze), size, offset, tile_size, start, end, index_path(start, end, solution), build_pyramid(maze), band_rows)
+
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a solved maze to a PNG or TIFF file band by band, or to an SVG")
+    parser.add_argument("output", help="the image to write (.png, .tif, .tiff or .svg)")
+    parser.add_argument("maze", help="a maze file, or the width of a new maze")
+    parser.add_argument("height", type=int, nargs="?")
+    parser.add_argument("--tile-size", type=float, help=f"pixels per tile, fits the maze in {IMAGE_SIZE}px by default")
+    parser.add_argument("--band-rows", type=int, default=BAND_ROWS, help="rows per band, rounded up to an even number")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.maze.isdigit():
+        width = int(args.maze)
+        maze = create_maze(width, args.height or width, args.threshold)
+    else:
+        maze, _ = load_maze(args.maze)
+
+    tile_size = args.tile_size or max(IMAGE_SIZE // max(maze_shape(maze)), 1)
+    w, h = export_maze(args.output, maze, tile_size, args.band_rows)
+    print(f"wrote {w}x{h} image to {args.output}")
@@ -1,93 +1,355 @@
-from numba import njit
+from numba import njit, prange, types
 
-import heapq as hq
 import numpy as np
 
-@njit(cache=True)
-def get_edge_heap(heap, nodes):
-    while (len(heap) > 0):
-        l, r = hq.heappop(heap)[1]
-        if not nodes[r]:
-            return l, r
+from packed import pack_edges
+
+DX = np.array([-1, 0, 1, 0])
+DY = np.array([0, -1, 0, 1])
+
+RANDOM_BLOCK = 1 << 14
+TILE_SIZE = 256
+SEED_STRIDE = 0x9E3779B1
+NO_SEED = -1
+JOIN_CHANCE = 0.5
 
-    assert False, "Unreachable"
+SIGNATURES = {
+    "create_maze": [(types.int64, types.int64, types.float64, types.int64)],
+    "create_packed_maze": [(types.int64, types.int64, types.float64, types.int64)],
+    "create_maze_parallel": [(types.int64, types.int64, types.float64, types.int64, types.int64)],
+    "stream_maze": [(types.boolean[:, ::1], types.float64, types.int64)],
+    "stream_packed_maze": [(types.int64, types.int64, types.uint8[::1], types.uint8[::1], types.float64, types.int64)],
+}
 
 
 @njit(cache=True)
-def get_edge_stack(stack, nodes):
-    while (len(stack) > 0):
-        l, r = hq.heappop(stack[-1])[1]
-        if len(stack[-1]) == 0:
-            stack.pop()
-        if not nodes[r]:
-            return l, r
-    
-    assert False, "Unreachable"
+def seed_random(seed, stream=0):
+    if seed != NO_SEED:
+        np.random.seed((seed + stream * SEED_STRIDE) & 0xFFFFFFFF)
 
 
 @njit(cache=True)
-def create_maze(width, height, threshold=0.5):
-    nodes = np.zeros((width, height), dtype=np.bool8)
-    h_edges = np.zeros((width - 1, height), dtype=np.bool8)
-    v_edges = np.zeros((width, height - 1), dtype=np.bool8)
+def heap_push(keys, edges, size, key, edge):
+    i = size
+    while i > 0:
+        parent = (i - 1) >> 1
+        if keys[parent] <= key:
+            break
+        keys[i] = keys[parent]
+        edges[i] = edges[parent]
+        i = parent
+
+    keys[i] = key
+    edges[i] = edge
+    return size + 1
+
+
+@njit(cache=True)
+def heap_pop(keys, edges, size):
+    edge = edges[0]
+    size -= 1
+    key = keys[size]
+    last = edges[size]
+
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= size:
+            break
+        if child + 1 < size and keys[child + 1] < keys[child]:
+            child += 1
+        if keys[child] >= key:
+            break
+        keys[i] = keys[child]
+        edges[i] = edges[child]
+        i = child
+
+    keys[i] = key
+    edges[i] = last
+    return edge, size
 
-    heap = []
-    stack = []
 
-    x = np.random.randint(0, width)
-    y = np.random.randint(0, height)
+@njit(cache=True)
+def carve(h_edges, v_edges, threshold):
+    width = v_edges.shape[0]
+    height = h_edges.shape[1]
+
+    nodes = np.zeros(width * height, dtype=np.bool8)
+    capacity = max(h_edges.size + v_edges.size, 1)
 
-    nodes[x, y] = True
-    if x > 0:
-        heap.append((np.random.rand(), ((x, y), (x - 1, y))))
-    if x < width - 1:
-        heap.append((np.random.rand(), ((x, y), (x + 1, y))))
-    if y > 0:
-        heap.append((np.random.rand(), ((x, y), (x, y - 1))))
-    if y < height - 1:
-        heap.append((np.random.rand(), ((x, y), (x, y + 1))))
+    keys = np.empty(capacity)
+    heap = np.empty(capacity, dtype=np.int64)
+    stack = np.empty(capacity, dtype=np.int64)
+    heap_size = 0
+    stack_size = 0
 
-    hq.heapify(heap)
-    stack.append([i for i in heap])
+    group_keys = np.empty(4)
+    group_edges = np.empty(4, dtype=np.int64)
 
+    block = np.random.rand(RANDOM_BLOCK)
+    pos = 0
 
+    cell = np.random.randint(0, width * height)
     remaining = width * height - 1
 
-    while remaining > 0:
-        if np.random.rand() < threshold:
-            l, r = get_edge_heap(heap, nodes)
+    while True:
+        if pos > RANDOM_BLOCK - 5:
+            block = np.random.rand(RANDOM_BLOCK)
+            pos = 0
+
+        nodes[cell] = True
+        x, y = divmod(cell, height)
+
+        group = 0
+        for d in range(4):
+            i = x + DX[d]
+            j = y + DY[d]
+            if i < 0 or i >= width or j < 0 or j >= height or nodes[i * height + j]:
+                continue
+
+            key = block[pos]
+            pos += 1
+            edge = cell * 4 + d
+            heap_size = heap_push(keys, heap, heap_size, key, edge)
+
+            k = group
+            while k > 0 and group_keys[k - 1] < key:
+                group_keys[k] = group_keys[k - 1]
+                group_edges[k] = group_edges[k - 1]
+                k -= 1
+            group_keys[k] = key
+            group_edges[k] = edge
+            group += 1
+
+        stack[stack_size:stack_size + group] = group_edges[:group]
+        stack_size += group
+
+        if remaining == 0:
+            break
+
+        use_heap = block[pos] < threshold
+        pos += 1
+        while True:
+            if use_heap:
+                edge, heap_size = heap_pop(keys, heap, heap_size)
+            else:
+                stack_size -= 1
+                edge = stack[stack_size]
+
+            l, d = divmod(edge, 4)
+            cell = l + DX[d] * height + DY[d]
+            if not nodes[cell]:
+                break
+
+        x, y = divmod(l, height)
+        if d % 2 == 0:
+            h_edges[min(x, x + DX[d]), y] = True
         else:
-            l, r = get_edge_stack(stack, nodes)
+            v_edges[x, min(y, y + DY[d])] = True
 
-        nodes[r] = True
         remaining -= 1
 
-        if r[0] != l[0]:
-            h_edges[min(r[0], l[0]), l[1]] = True
+
+@njit(cache=True)
+def find(sets, i):
+    while sets[i] != i:
+        sets[i] = sets[sets[i]]
+        i = sets[i]
+
+    return i
+
+
+@njit(cache=True)
+def join_tiles(h_edges, v_edges, tile_size):
+    width = v_edges.shape[0]
+    height = h_edges.shape[1]
+    tiles_x = (width + tile_size - 1) // tile_size
+    tiles_y = (height + tile_size - 1) // tile_size
+
+    borders = []
+    for x in range(tile_size - 1, width - 1, tile_size):
+        for y in range(height):
+            borders.append((x * height + y) * 2)
+    for y in range(tile_size - 1, height - 1, tile_size):
+        for x in range(width):
+            borders.append((x * height + y) * 2 + 1)
+
+    order = np.array(borders)
+    np.random.shuffle(order)
+
+    sets = np.arange(tiles_x * tiles_y)
+    remaining = tiles_x * tiles_y - 1
+
+    for edge in order:
+        if remaining == 0:
+            break
+
+        cell, vertical = divmod(edge, 2)
+        x, y = divmod(cell, height)
+        a = (x // tile_size) * tiles_y + y // tile_size
+        b = a + 1 if vertical else a + tiles_y
+
+        a = find(sets, a)
+        b = find(sets, b)
+        if a == b:
+            continue
+
+        sets[a] = b
+        remaining -= 1
+
+        if vertical:
+            v_edges[x, y] = True
         else:
-            v_edges[l[0], min(r[1], l[1])] = True
-
-        x, y = r
-        next = []
-
-        if x > 0 and x != l[0] + 1:
-            next.append((np.random.rand(), (r, (x - 1, y))))
-        if x < width - 1 and x != l[0] - 1:
-            next.append((np.random.rand(), (r, (x + 1, y))))
-        if y > 0 and y != l[1] + 1:
-            next.append((np.random.rand(), (r, (x, y - 1))))
-        if y < height - 1 and y != l[1] - 1:
-            next.append((np.random.rand(), (r, (x, y + 1))))
-
-        for i in next:
-            hq.heappush(heap, i)
-
-        hq.heapify(next)    
-        stack.append(next)
-    
+            h_edges[x, y] = True
+
+
+@njit(cache=True)
+def expand(h_edges, v_edges):
+    width = v_edges.shape[0]
+    height = h_edges.shape[1]
+
     maze = np.zeros((2 * (width - 1) + 1, 2 * (height - 1) + 1), dtype=np.bool8)
     maze[::2, ::2] = True
     maze[1::2, ::2] = h_edges
     maze[::2, 1::2] = v_edges
-    
+
     return maze
+
+
+@njit(cache=True)
+def create_maze(width, height, threshold=0.5, seed=NO_SEED):
+    h_edges = np.zeros((width - 1, height), dtype=np.bool8)
+    v_edges = np.zeros((width, height - 1), dtype=np.bool8)
+
+    seed_random(seed)
+    carve(h_edges, v_edges, threshold)
+    return expand(h_edges, v_edges)
+
+
+@njit(cache=True)
+def create_packed_maze(width, height, threshold=0.5, seed=NO_SEED):
+    h_edges = np.zeros((width - 1, height), dtype=np.bool8)
+    v_edges = np.zeros((width, height - 1), dtype=np.bool8)
+
+    seed_random(seed)
+    carve(h_edges, v_edges, threshold)
+    return pack_edges(h_edges, v_edges)
+
+
+@njit(cache=True, parallel=True)
+def create_maze_parallel(width, height, threshold=0.5, tile_size=TILE_SIZE, seed=NO_SEED):
+    h_edges = np.zeros((width - 1, height), dtype=np.bool8)
+    v_edges = np.zeros((width, height - 1), dtype=np.bool8)
+
+    tiles_x = (width + tile_size - 1) // tile_size
+    tiles_y = (height + tile_size - 1) // tile_size
+
+    for t in prange(tiles_x * tiles_y):
+        x0 = t // tiles_y * tile_size
+        y0 = t % tiles_y * tile_size
+        x1 = min(x0 + tile_size, width)
+        y1 = min(y0 + tile_size, height)
+        seed_random(seed, t + 1)
+        carve(h_edges[x0:x1 - 1, y0:y1], v_edges[x0:x1, y0:y1 - 1], threshold)
+
+    seed_random(seed)
+    join_tiles(h_edges, v_edges, tile_size)
+    return expand(h_edges, v_edges)
+
+
+@njit(cache=True)
+def eller_state(height):
+    labels = np.arange(height)
+    sets = np.empty(height, dtype=np.int64)
+    counts = np.empty(height, dtype=np.int64)
+    picks = np.empty(height, dtype=np.int64)
+    down = np.empty(height - 1, dtype=np.bool8)
+    right = np.empty(height, dtype=np.bool8)
+
+    return labels, sets, counts, picks, down, right
+
+
+@njit(cache=True)
+def eller_column(state, threshold, last):
+    labels, sets, counts, picks, down, right = state
+    height = labels.shape[0]
+    block = np.random.rand(3 * height)
+
+    for y in range(height):
+        sets[y] = y
+
+    a = find(sets, labels[0])
+    for y in range(height - 1):
+        b = find(sets, labels[y + 1])
+        down[y] = a != b and (last or block[y] < JOIN_CHANCE)
+        if down[y]:
+            sets[a] = b
+        a = b
+
+    if last:
+        return
+
+    counts[:] = 0
+    for y in range(height):
+        r = find(sets, labels[y])
+        counts[r] += 1
+        if block[height + y] * counts[r] < 1:
+            picks[r] = y
+        right[y] = block[2 * height + y] < threshold
+
+    for y in range(height):
+        if right[y]:
+            picks[find(sets, labels[y])] = y
+
+    for r in range(height):
+        if counts[r] > 0:
+            right[picks[r]] = True
+
+    counts[:] = -1
+    next_label = 0
+    for y in range(height):
+        if right[y]:
+            r = find(sets, labels[y])
+            if counts[r] < 0:
+                counts[r] = next_label
+                next_label += 1
+            labels[y] = counts[r]
+        else:
+            labels[y] = next_label
+            next_label += 1
+
+
+@njit(cache=True)
+def stream_maze(maze, threshold=0.5, seed=NO_SEED):
+    width = (maze.shape[0] + 1) // 2
+    height = (maze.shape[1] + 1) // 2
+    state = eller_state(height)
+    _, _, _, _, down, right = state
+
+    seed_random(seed)
+    for x in range(width):
+        eller_column(state, threshold, x == width - 1)
+        maze[2 * x, ::2] = True
+        maze[2 * x, 1::2] = down
+        if x < width - 1:
+            maze[2 * x + 1, ::2] = right
+
+
+@njit(cache=True)
+def stream_packed_maze(width, height, h_bits, v_bits, threshold=0.5, seed=NO_SEED):
+    state = eller_state(height)
+    _, _, _, _, down, right = state
+
+    seed_random(seed)
+    for x in range(width):
+        eller_column(state, threshold, x == width - 1)
+        for y in range(height - 1):
+            if down[y]:
+                i = x * (height - 1) + y
+                v_bits[i >> 3] |= 1 << (i & 7)
+
+        if x < width - 1:
+            for y in range(height):
+                if right[y]:
+                    i = x * height + y
+                    h_bits[i >> 3] |= 1 << (i & 7)
@@ -0,0 +1,169 @@
+import threading
+
+import numpy as np
+
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+
+import kernels
+import renderer
+
+from renderer import draw_path, frame_buffer, line_style, shade, shade_lod, LOD_SCALE
+from solver import flood, get_endpoints, level_search, make_taut, reconstruct, tree_tunnel, uses_levels
+from theta import lazy_theta
+from util import maze_shape, EMPTY_POINT
+
+WINDOW = 512
+PERCENTILES = (50, 90, 99)
+COUNTERS = ("solve.nodes", "solve.tunnel_length", "solve.vertices")
+
+enabled = False
+
+
+class Histogram:
+    def __init__(self, window=WINDOW):
+        self.values = deque(maxlen=window)
+        self.total = 0
+        self.lock = threading.Lock()
+
+
+    def add(self, value):
+        with self.lock:
+            self.values.append(value)
+            self.total += 1
+
+
+    def summary(self):
+        with self.lock:
+            values = np.array(self.values, dtype=np.float64)
+            total = self.total
+
+        if len(values) == 0:
+            return {"total": total, "count": 0}
+
+        summary = {"total": total, "count": len(values), "mean": values.mean(), "max": values.max()}
+        for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            summary[f"p{p}"] = v
+
+        return summary
+
+
+histograms = {}
+histograms_lock = threading.Lock()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def record(name, value):
+    histogram = histograms.get(name)
+    if histogram is None:
+        with histograms_lock:
+            histogram = histograms.setdefault(name, Histogram())
+
+    histogram.add(value)
+
+
+@contextmanager
+def stage(name):
+    start = perf_counter()
+    yield
+    record(name, perf_counter() - start)
+
+
+def stats():
+    with histograms_lock:
+        items = list(histograms.items())
+
+    return {name: histogram.summary() for name, histogram in sorted(items)}
+
+
+def reset():
+    with histograms_lock:
+        histograms.clear()
+
+
+def solve_maze(maze, start, end, index=None, engine="tunnel"):
+    if not enabled:
+        return kernels.solve(maze, start, end, index, engine)
+
+    if engine == "theta":
+        with stage("solve"):
+            with stage("solve.theta"):
+                dist, path, nodes = lazy_theta(maze, start, end)
+
+        record("solve.nodes", nodes)
+        record("solve.vertices", path.shape[0])
+
+        return dist, path
+
+    with stage("solve"):
+        with stage("solve.endpoints"):
+            start_tiles, end_tiles = get_endpoints(maze, start, end)
+
+        if uses_levels(maze, index):
+            with stage("solve.levels"):
+                tunnel = level_search(maze, start_tiles, end_tiles)
+        elif index is None:
+            visited = np.zeros(maze_shape(maze), dtype=np.bool8)
+            come_from = np.empty(maze_shape(maze), dtype=np.int8)
+
+            with stage("solve.bfs"):
+                goal, nodes = flood(maze, start_tiles, end_tiles, visited, come_from)
+            assert goal != EMPTY_POINT, "Maze isn't solvable"
+
+            with stage("solve.reconstruct"):
+                tunnel = reconstruct(come_from, start_tiles, goal)
+            record("solve.nodes", nodes)
+        else:
+            with stage("solve.tunnel"):
+                tunnel = tree_tunnel(index, start_tiles, end_tiles)
+
+        with stage("solve.taut"):
+            dist, path = make_taut(tunnel, start, end)
+
+    record("solve.tunnel_length", tunnel.shape[0])
+    record("solve.vertices", path.shape[0])
+
+    return dist, path
+
+
+def render(table, size, offset, scale, start, end, path_index, pyramid=None, heat=None, out=None):
+    if not enabled:
+        return renderer.render(table, size, offset, scale, start, end, path_index, pyramid, heat, out)
+
+    lod = pyramid is not None and scale < LOD_SCALE
+
+    with stage("render"):
+        buf = frame_buffer(size, out)
+
+        with stage("render.path"):
+            visible = np.array(draw_path(buf, size, offset, scale, path_index, 1.0 if lod else line_style(scale)[0]), dtype=np.int64)
+
+        if lod:
+            with stage("render.lod"):
+                shade_lod(buf, pyramid, size, offset, scale, start, end, heat)
+        else:
+            with stage("render.pixels"):
+                shade(buf, table, size, offset, scale, start, end, path_index[0], visible, heat)
+
+    return buf
+
+
+def report():
+    lines = []
+    for name, summary in stats().items():
+        if summary["count"] == 0:
+            continue
+
+        if name in COUNTERS:
+            values = " ".join(f"p{p} {summary[f'p{p}']:.0f}" for p in PERCENTILES)
+        else:
+            values = " ".join(f"p{p} {summary[f'p{p}'] * 1e3:.2f}ms" for p in PERCENTILES)
+
+        lines.append(f"{name:<20} {values}  n={summary['total']}")
+
+    return "\n".join(lines)
@@ -0,0 +1,121 @@
+import argparse
+import os
+
+from time import perf_counter
+from numba import typeof
+from numba.core.registry import CPUDispatcher as Dispatcher
+
+import generator
+import renderer
+import solver
+import theta
+import util
+
+try:
+    import maze_aot
+except ModuleNotFoundError:
+    maze_aot = None
+
+
+MODULES = (util, generator, solver, theta, renderer)
+AOT_NAME = "maze_aot"
+ENGINES = ("tunnel", "theta")
+
+
+def warm_up():
+    timings = {}
+    for module in MODULES:
+        for name, signatures in module.SIGNATURES.items():
+            start = perf_counter()
+            for sig in signatures:
+                getattr(module, name).compile(sig)
+            timings[name] = perf_counter() - start
+
+    return timings
+
+
+def build_aot(output_dir=os.path.dirname(os.path.abspath(__file__))):
+    from numba.pycc import CC
+
+    cc = CC(AOT_NAME)
+    cc.output_dir = output_dir
+
+    for module in MODULES:
+        for name, signatures in module.SIGNATURES.items():
+            jit = getattr(module, name)
+            if reaches_parallel(jit):
+                continue
+
+            for i, sig in enumerate(signatures):
+                jit.compile(sig)
+                cc.export(f"{name}_{i}", jit.overloads[tuple(sig)].signature)(jit.py_func)
+
+    cc.compile()
+
+
+def reaches_parallel(jit, seen=None):
+    seen = seen if seen is not None else set()
+    seen.add(jit)
+    if jit.targetoptions.get("parallel"):
+        return True
+
+    code = jit.py_func.__code__
+    callees = (jit.py_func.__globals__.get(name) for name in code.co_names)
+    return any(isinstance(callee, Dispatcher) and callee not in seen and reaches_parallel(callee, seen) for callee in callees)
+
+
+class Kernel:
+    def __init__(self, module, name):
+        self.jit = getattr(module, name)
+        self.aot = {}
+
+        if maze_aot is not None:
+            for i, sig in enumerate(module.SIGNATURES[name]):
+                compiled = getattr(maze_aot, f"{name}_{i}", None)
+                if compiled is not None:
+                    self.aot[tuple(sig)] = compiled
+
+
+    def __call__(self, *args):
+        code = self.jit.py_func.__code__
+        defaults = self.jit.py_func.__defaults__ or ()
+        args += defaults[len(defaults) - (code.co_argcount - len(args)):]
+
+        if self.aot:
+            sig = tuple(typeof(arg) for arg in args)
+            if sig in self.aot and sig not in self.jit.overloads:
+                return self.aot[sig](*args)
+
+        return self.jit(*args)
+
+
+create_maze = Kernel(generator, "create_maze")
+build_index = Kernel(solver, "build_index")
+solve_maze = Kernel(solver, "solve_maze")
+solve_levels = Kernel(solver, "solve_levels")
+distance_field = Kernel(solver, "distance_field")
+solve_theta = Kernel(theta, "solve_theta")
+index_path = Kernel(renderer, "index_path")
+
+
+def solve(maze, start, end, index=None, engine="tunnel"):
+    assert engine in ENGINES, f"Unknown engine {engine}"
+    if engine == "theta":
+        return solve_theta(maze, start, end)
+    if solver.uses_levels(maze, index):
+        return solve_levels(maze, start, end)
+    return solve_maze(maze, start, end, index)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the numba kernels ahead of time")
+    parser.add_argument("--aot", action="store_true", help=f"build the {AOT_NAME} extension module")
+    args = parser.parse_args()
+
+    if args.aot:
+        start = perf_counter()
+        build_aot()
+        print(f"built {AOT_NAME} in {perf_counter() - start:.2f}s")
+    else:
+        for name, seconds in warm_up().items():
+            print(f"{name:<22}{seconds:8.3f}s")
@@ -1,18 +1,48 @@
+from time import perf_counter
+STARTED = perf_counter()
+
 import tkinter as tk
 import sys
+import threading
+
+import numpy as np
 
 from tkinter import font
 from math import floor
 from PIL import Image, ImageTk
 
-from util import bound_check, from_screen, EMPTY_POINT_F, empty_path
-from renderer import render
-from generator import create_maze
-from solver import solve_maze
+from util import is_walkable, maze_shape, from_screen, EMPTY_POINT_F, empty_path
+from renderer import build_pyramid, classify, heatmap
+from tilecache import TileCache
+from searchcache import SearchCache
+from worker import Worker
+from kernels import create_maze, build_index, distance_field, index_path, warm_up, ENGINES
+from mazefile import load_maze
+from solver import uses_levels
+
+import instrument
+
+STARTUP = [("start", STARTED), ("import", perf_counter())]
+
+
+def mark(stage):
+    if STARTUP[-1][0] == "first frame":
+        return
+
+    STARTUP.append((stage, perf_counter()))
+    if stage == "first frame":
+        stages = ", ".join(f"{name} {t - last:.3f}s" for (_, last), (name, t) in zip(STARTUP, STARTUP[1:]))
+        print(f"Startup: {stages}, total {STARTUP[-1][1] - STARTUP[0][1]:.3f}s")
+        threading.Thread(target=warm_up, daemon=True).start()
 
 
 class Display(tk.Label):
     INIT_TILE_SIZE = 10
+    MIN_TILE_SIZE = 1 / 256
+    ZOOM_STEP_SIZE = 3
+    POLL_INTERVAL = 10
+    STATS_INTERVAL = 500
+    STATS_MARGIN = 5
 
     def __init__(self, master, maze, display_start, display_end, display_dist):
         tk.Label.__init__(self, master, background='#ffffff')
@@ -24,12 +54,34 @@ class Display(tk.Label):
         self.display_end = display_end
         self.display_dist = display_dist
         self.set_start = True
+        self.engine = ENGINES[0]
 
         self.start_pos = EMPTY_POINT_F
         self.end_pos = EMPTY_POINT_F
         self.path = empty_path()
+        self.overlay = (self.start_pos, self.end_pos, index_path(self.start_pos, self.end_pos, self.path))
+        self.tiles = TileCache()
+        self.searches = SearchCache()
+
+        self.stats = tk.Label(self, font=("TkFixedFont", 9), justify=tk.LEFT, anchor=tk.NW, background='#ffffff')
+        self.worker = Worker()
+        self.maze_generation = 0
+        self.solve_generation = 0
+        self.frame_generation = 0
+        self.heat_generation = 0
+        self.show_heat = False
+        self.heat = None
+        self.index = None
+        self.table = None
+        self.pyramid = None
+
+        self.frames = ()
+        self.back = 0
+        self.frame = None
+        self.image = None
 
         self.update_maze(maze)
+        self.after(self.POLL_INTERVAL, self.poll)
         self.bind("<Configure>", self.resize)
 
         self.pressed = False
@@ -37,6 +89,7 @@ class Display(tk.Label):
         self.bind("<Button-1>", self.mouse_down) 
         self.bind("<ButtonRelease-1>", self.mouse_up) 
         self.bind("<Button1-Motion>", self.mouse_move)
+        self.bind("<ButtonRelease-3>", self.place_end)
         self.bind("<Button-4>", self.mouse_wheel)
         self.bind("<Button-5>", self.mouse_wheel)
         self.bind("<MouseWheel>", self.mouse_wheel)
@@ -47,16 +100,143 @@ class Display(tk.Label):
 
 
     def redraw(self):
-        if self.width * self.height > 0:
-            buf = render(self.maze, (self.width, self.height), self.offset, self.tile_size, self.start_pos, self.end_pos, self.path)
-            img = Image.fromarray(buf)
-            self.image = ImageTk.PhotoImage(img)
-            self.configure(image=self.image)
+        if self.width * self.height > 0 and self.table is not None:
+            self.worker.submit("render", self.render_frame, self.frames, self.table, (self.width, self.height), self.offset, self.tile_size, *self.overlay, self.pyramid, self.heat)
+
+
+    def render_frame(self, frames, *args):
+        back = self.back
+        buf, lock = frames[back]
+
+        start = perf_counter()
+        with lock:
+            self.tiles.render(*args, out=buf)
+        if instrument.enabled:
+            instrument.record("frame", perf_counter() - start)
+
+        return back, buf, lock
+
+
+    def show(self, frame):
+        back, buf, lock = frame
+        h, w, _ = buf.shape
+        self.back = 1 - back
+
+        with lock:
+            if self.frame is None or self.frame.size != (w, h):
+                self.frame = Image.fromarray(buf)
+                self.image = ImageTk.PhotoImage(self.frame)
+                self.configure(image=self.image)
+            else:
+                self.frame.frombytes(buf)
+                self.image.paste(self.frame)
+        mark("first frame")
+
+
+    def solve(self, maze, index, start, end, engine):
+        if engine == "tunnel" and index is None and not uses_levels(maze):
+            dist, path = self.searches.solve(maze, start, end)
+        else:
+            dist, path = instrument.solve_maze(maze, start, end, index, engine)
+        return dist, path, (start, end, index_path(start, end, path))
+
+
+    def set_overlay(self, overlay):
+        self.worker.submit(None, self.tiles.invalidate, *self.overlay)
+        self.worker.submit(None, self.tiles.invalidate, *overlay)
+        self.overlay = overlay
+        self.redraw()
+
+
+    def poll(self):
+        self.after(self.POLL_INTERVAL, self.poll)
+
+        frame = None
+        for key, generation, result in self.worker.poll():
+            if isinstance(result, Exception):
+                raise result
+
+            if generation < self.maze_generation:
+                continue
+
+            if key == "render" and generation > self.frame_generation:
+                self.frame_generation = generation
+                frame = result
+            elif key == "solve" and generation == self.solve_generation:
+                dist, self.path, overlay = result
+                self.display_dist(dist)
+                self.set_overlay(overlay)
+            elif key == "heat" and generation == self.heat_generation:
+                self.set_heat(result)
+            elif key == "prepare" and generation == self.maze_generation:
+                self.index, self.table, self.pyramid = result
+                mark("prepare")
+                self.redraw()
+
+        if frame is not None:
+            self.show(frame)
+
+
+    def toggle_stats(self, e=None):
+        instrument.enable(not instrument.enabled)
+        if instrument.enabled:
+            self.stats.place(x=self.STATS_MARGIN, y=self.STATS_MARGIN)
+            self.show_stats()
+        else:
+            self.stats.place_forget()
+
+
+    def show_stats(self):
+        if instrument.enabled:
+            self.stats.configure(text=instrument.report() or "Waiting for a frame or a solve...")
+            self.after(self.STATS_INTERVAL, self.show_stats)
+
+
+    def toggle_heat(self, e=None):
+        self.show_heat = not self.show_heat
+        self.update_heat()
+
+
+    def update_heat(self):
+        if self.show_heat and self.start_pos != EMPTY_POINT_F:
+            self.heat_generation = self.worker.submit("heat", self.compute_heat, self.maze, self.start_pos)
+        else:
+            self.worker.cancel("heat")
+            self.heat_generation = self.worker.generation
+            if self.heat is not None:
+                self.set_heat(None)
+
+
+    def compute_heat(self, maze, start):
+        return heatmap(distance_field(maze, start))
+
+
+    def set_heat(self, heat):
+        self.heat = heat
+        self.worker.submit(None, self.tiles.clear)
+        self.redraw()
+
+
+    def prepare(self, maze):
+        self.searches.clear()
+        self.tiles.clear()
+        try:
+            index = build_index(maze)
+        except AssertionError:
+            index = None
+        return index, classify(maze), build_pyramid(maze)
 
 
     def update_maze(self, new_maze):
         self.maze = new_maze
-        maze_w, maze_h = self.maze.shape
+        self.index = None
+        self.table = None
+        self.pyramid = None
+        self.worker.cancel("solve")
+        self.worker.cancel("heat")
+        self.heat = None
+        self.maze_generation = self.worker.submit("prepare", self.prepare, self.maze)
+        maze_w, maze_h = maze_shape(self.maze)
 
         self.tile_size = self.INIT_TILE_SIZE
         self.offset = (self.tile_size * maze_w / 2, self.tile_size * maze_h / 2)
@@ -64,12 +244,13 @@ class Display(tk.Label):
         self.end_pos = EMPTY_POINT_F
         self.set_start = True
         self.path = empty_path()
-        self.redraw()
+        self.overlay = (self.start_pos, self.end_pos, index_path(self.start_pos, self.end_pos, self.path))
 
 
     def resize(self, event):
         self.width = event.width // 2 * 2
         self.height = event.height // 2 * 2
+        self.frames = tuple((np.empty((self.height, self.width, 3), dtype=np.uint8), threading.Lock()) for _ in range(2))
 
         self.configure(width=event.width, height=event.height)
         self.redraw()
@@ -88,22 +269,45 @@ class Display(tk.Label):
         dx = abs(self.last_x - e.x - last_x)
         dy = abs(self.last_y - e.y - last_y)
         if max(dx, dy) < self.tile_size / 10:
-            x, y = self.from_screen((e.x, e.y))
-            x_tile, y_tile = floor(x), floor(y)
-            
-            if bound_check(self.maze, x_tile, y_tile):
-                if self.set_start:
-                    self.start_pos = (x, y)
-                    self.display_start(x, y)
-                else:
-                    self.end_pos = (x, y)
-                    self.display_end(x, y)
-                
-                if self.end_pos != EMPTY_POINT_F:
-                    dist, self.path = solve_maze(self.maze, self.start_pos, self.end_pos)
-                    self.display_dist(dist)
+            if self.place((e.x, e.y), self.set_start):
                 self.set_start = not self.set_start
-                self.redraw()
+
+
+    def place_end(self, e):
+        if self.start_pos != EMPTY_POINT_F and self.place((e.x, e.y), False):
+            self.set_start = True
+
+
+    def place(self, p, is_start):
+        x, y = self.from_screen(p)
+        if self.table is None or not is_walkable(self.maze, floor(x), floor(y)):
+            return False
+
+        if is_start:
+            self.start_pos = (x, y)
+            self.display_start(x, y)
+            if self.show_heat:
+                self.update_heat()
+        else:
+            self.end_pos = (x, y)
+            self.display_end(x, y)
+
+        if self.end_pos != EMPTY_POINT_F:
+            self.submit_solve()
+        else:
+            self.set_overlay((self.start_pos, self.end_pos, index_path(self.start_pos, self.end_pos, self.path)))
+
+        return True
+
+
+    def submit_solve(self):
+        self.solve_generation = self.worker.submit("solve", self.solve, self.maze, self.index, self.start_pos, self.end_pos, self.engine)
+
+
+    def set_engine(self, engine):
+        self.engine = engine
+        if self.start_pos != EMPTY_POINT_F and self.end_pos != EMPTY_POINT_F:
+            self.submit_solve()
 
 
     def mouse_move(self, e):
@@ -120,10 +324,14 @@ class Display(tk.Label):
         y /= self.tile_size
 
         if e.delta:
-            self.tile_size += e.delta / 120
+            step = e.delta / 120
+        else:
+            step = 1 if e.num == 4 else -1
+
+        if self.tile_size + step >= self.ZOOM_STEP_SIZE:
+            self.tile_size += step
         else:
-            self.tile_size += 1 if e.num == 4 else -1
-            self.tile_size = max(self.tile_size, 3)
+            self.tile_size = max(self.tile_size * 2 ** step, self.MIN_TILE_SIZE)
 
         x *= self.tile_size
         y *= self.tile_size
@@ -143,7 +351,7 @@ class App(tk.Tk):
     MAZE_BRANCHING = 0.1
 
 
-    def __init__(self, maze_width, maze_height):
+    def __init__(self, maze_width, maze_height, maze=None):
         tk.Tk.__init__(self, className="mazesolver")
 
         self.title("Maze solver")
@@ -151,6 +359,7 @@ class App(tk.Tk):
 
         self.inp_width = tk.StringVar(value=maze_width)
         self.inp_height = tk.StringVar(value=maze_height)
+        self.engine = tk.StringVar(value=ENGINES[0])
 
         self.start_pos = EMPTY_POINT_F
         self.end_pos = EMPTY_POINT_F
@@ -163,14 +372,18 @@ class App(tk.Tk):
 
         self.top_frame().pack(padx=self.PADDING / 2, pady=self.PADDING, fill='x')
 
-        maze = create_maze(maze_width, maze_height, self.MAZE_BRANCHING)
-            
+        if maze is None:
+            maze = create_maze(maze_width, maze_height, self.MAZE_BRANCHING)
+        mark("maze")
+
         update_start = lambda x, y: self.display_start.set(f"Start: ({x:.2f}, {y:.2f})")
         update_end = lambda x, y: self.display_end.set(f"End: ({x:.2f}, {y:.2f})")
         update_dist = lambda d: self.display_dist.set(f"Distance: {d:.2f}")
 
         self.renderer = Display(self, maze, update_start, update_end, update_dist)
         self.renderer.pack(fill=tk.BOTH, expand=tk.YES)
+        self.bind("<F2>", self.renderer.toggle_stats)
+        self.bind("<F3>", self.renderer.toggle_heat)
 
 
     def create_maze(self):
@@ -205,6 +418,9 @@ class App(tk.Tk):
 
         tk.Button(frame, text="Generate Maze", font=self.font, command=self.create_maze).pack(side=tk.LEFT, padx=self.PADDING / 2)
 
+        tk.Label(frame, text="Solver:", font=self.font).pack(side=tk.LEFT, padx=self.PADDING / 2)
+        tk.OptionMenu(frame, self.engine, *ENGINES, command=lambda engine: self.renderer.set_engine(engine)).pack(side=tk.LEFT, padx=self.PADDING / 2)
+
         return frame
 
 
@@ -230,8 +446,12 @@ class App(tk.Tk):
 if __name__ == "__main__":
     ws = sys.argv[1:]
     hs = sys.argv[2:]
-    
-    w = int(ws[0]) if len(ws) else 40
-    h = int(hs[0]) if len(hs) else w
 
-    App(w, h).mainloop()
+    if len(ws) and not ws[0].isdigit():
+        maze, info = load_maze(ws[0])
+        App(info.width, info.height, maze).mainloop()
+    else:
+        w = int(ws[0]) if len(ws) else 40
+        h = int(hs[0]) if len(hs) else w
+
+        App(w, h).mainloop()
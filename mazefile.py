@@ -0,0 +1,132 @@
+from collections import namedtuple
+
+import argparse
+import struct
+import numpy as np
+
+from generator import create_maze, create_packed_maze, create_maze_parallel, stream_maze, stream_packed_maze, NO_SEED, TILE_SIZE
+from packed import pack_maze
+
+
+MAGIC = b"MAZE"
+VERSION = 1
+HEADER = struct.Struct("<4sHBBIIdq")
+
+LAYOUT_RAW = 0
+LAYOUT_PACKED = 1
+
+GENERATOR_UNKNOWN = 0
+GENERATOR_GROWING_TREE = 1
+GENERATOR_TILED = 2
+GENERATOR_ELLER = 3
+
+MazeInfo = namedtuple("MazeInfo", ["layout", "generator", "width", "height", "threshold", "seed"])
+
+
+def generate_maze(width, height, threshold, seed, packed=False, parallel=False):
+    if parallel:
+        maze = create_maze_parallel(width, height, threshold, TILE_SIZE, seed)
+        return (pack_maze(maze) if packed else maze), GENERATOR_TILED
+
+    if packed:
+        return create_packed_maze(width, height, threshold, seed), GENERATOR_GROWING_TREE
+    return create_maze(width, height, threshold, seed), GENERATOR_GROWING_TREE
+
+
+def random_seed():
+    return int(np.random.default_rng().integers(1 << 32))
+
+
+def save_maze(path, maze, threshold=np.nan, seed=NO_SEED, generator=GENERATOR_GROWING_TREE):
+    if isinstance(maze, tuple):
+        width, height, h_bits, v_bits = maze
+        layout = LAYOUT_PACKED
+        blocks = [h_bits, v_bits]
+    else:
+        width = (maze.shape[0] + 1) // 2
+        height = (maze.shape[1] + 1) // 2
+        layout = LAYOUT_RAW
+        blocks = [maze]
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, layout, generator, width, height, threshold, seed))
+        for block in blocks:
+            np.ascontiguousarray(block, dtype=np.uint8).tofile(f)
+
+
+def read_info(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+
+    assert len(header) == HEADER.size, "Not a maze file"
+    magic, version, *fields = HEADER.unpack(header)
+
+    assert magic == MAGIC, "Not a maze file"
+    assert version == VERSION, f"Unsupported maze file version {version}"
+
+    return MazeInfo(*fields)
+
+
+def packed_sizes(width, height):
+    return ((width - 1) * height + 7) // 8, (width * (height - 1) + 7) // 8
+
+
+def map_block(path, dtype, offset, shape, mode="r"):
+    if np.prod(shape) == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.asarray(np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=shape))
+
+
+def load_maze(path):
+    info = read_info(path)
+    width, height = info.width, info.height
+
+    if info.layout == LAYOUT_RAW:
+        maze = map_block(path, np.bool8, HEADER.size, (2 * width - 1, 2 * height - 1))
+    else:
+        h_size, v_size = packed_sizes(width, height)
+        h_bits = map_block(path, np.uint8, HEADER.size, (h_size,))
+        v_bits = map_block(path, np.uint8, HEADER.size + h_size, (v_size,))
+        maze = (width, height, h_bits, v_bits)
+
+    return maze, info
+
+
+def stream_to_file(path, width, height, threshold=0.5, seed=NO_SEED, packed=False):
+    layout = LAYOUT_PACKED if packed else LAYOUT_RAW
+    h_size, v_size = packed_sizes(width, height)
+    size = h_size + v_size if packed else (2 * width - 1) * (2 * height - 1)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, layout, GENERATOR_ELLER, width, height, threshold, seed))
+        f.truncate(HEADER.size + size)
+
+    if packed:
+        h_bits = map_block(path, np.uint8, HEADER.size, (h_size,), "r+")
+        v_bits = map_block(path, np.uint8, HEADER.size + h_size, (v_size,), "r+")
+        stream_packed_maze(width, height, h_bits, v_bits, threshold, seed)
+    else:
+        maze = map_block(path, np.bool8, HEADER.size, (2 * width - 1, 2 * height - 1), "r+")
+        stream_maze(maze, threshold, seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a maze and save it to a file")
+    parser.add_argument("output")
+    parser.add_argument("width", type=int)
+    parser.add_argument("height", type=int, nargs="?")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--packed", action="store_true")
+    parser.add_argument("--parallel", action="store_true")
+    parser.add_argument("--stream", action="store_true", help="write the maze column by column without holding it in memory")
+    parser.add_argument("--seed", type=int, help="random by default, the one used is saved in the header")
+    args = parser.parse_args()
+
+    seed = random_seed() if args.seed is None else args.seed
+    height = args.height or args.width
+
+    if args.stream:
+        stream_to_file(args.output, args.width, height, args.threshold, seed, args.packed)
+    else:
+        maze, generator = generate_maze(args.width, height, args.threshold, seed, args.packed, args.parallel)
+        save_maze(args.output, maze, args.threshold, seed, generator)
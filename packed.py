@@ -0,0 +1,66 @@
+from numba import njit
+
+import numpy as np
+
+
+@njit(cache=True)
+def pack_bits(bits):
+    width, height = bits.shape
+    packed = np.zeros((width * height + 7) // 8, dtype=np.uint8)
+
+    for x in range(width):
+        for y in range(height):
+            if bits[x, y]:
+                i = x * height + y
+                packed[i >> 3] |= 1 << (i & 7)
+
+    return packed
+
+
+@njit(cache=True, inline='always')
+def get_bit(packed, i):
+    return (packed[i >> 3] >> (i & 7)) & 1 == 1
+
+
+@njit(cache=True)
+def pack_edges(h_edges, v_edges):
+    width = v_edges.shape[0]
+    height = h_edges.shape[1]
+    return width, height, pack_bits(h_edges), pack_bits(v_edges)
+
+
+@njit(cache=True)
+def pack_maze(maze):
+    return pack_edges(maze[1::2, ::2], maze[::2, 1::2])
+
+
+@njit(cache=True)
+def packed_shape(packed):
+    width, height, _, _ = packed
+    return 2 * width - 1, 2 * height - 1
+
+
+@njit(cache=True, inline='always')
+def packed_walkable(packed, x, y):
+    width, height, h_bits, v_bits = packed
+
+    if x < 0 or x >= 2 * width - 1 or y < 0 or y >= 2 * height - 1:
+        return False
+
+    i, j = x >> 1, y >> 1
+    if x & 1 == 0:
+        return y & 1 == 0 or get_bit(v_bits, i * (height - 1) + j)
+
+    return y & 1 == 0 and get_bit(h_bits, i * height + j)
+
+
+@njit(cache=True)
+def unpack_maze(packed):
+    width, height = packed_shape(packed)
+    maze = np.zeros((width, height), dtype=np.bool8)
+
+    for x in range(width):
+        for y in range(height):
+            maze[x, y] = packed_walkable(packed, x, y)
+
+    return maze
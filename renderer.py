@@ -1,8 +1,9 @@
-from numba import njit, prange
+from numba import njit, prange, types
+from numba.typed import List
 import numpy as np
 
-from math import floor
-from util import bound_check, from_screen, to_screen, EMPTY_POINT_F
+from math import floor, ceil
+from util import from_screen, to_screen, is_walkable, maze_shape, EMPTY_POINT_F, MAZE_TYPES, PATH, POINT, POINT_F, SCALES
 
 
 COLOR_FILL = np.array([191, 219, 254])
@@ -13,9 +14,45 @@ COLOR_BACKGROUND = np.array([255, 255, 255], dtype=np.uint8)
 COLOR_START = np.array([22, 163, 74], dtype=np.uint8)
 COLOR_END = np.array([220, 38, 38], dtype=np.uint8)
 
+HEAT_NEAR = np.array([253, 186, 116])
+HEAT_FAR = np.array([165, 180, 252])
+
 LINE_WIDTH = 1 / 20
 DOT_RADIUS = 3 / 20
 
+LOD_SCALE = 1
+PATH_BUCKET = 16
+
+WALKABLE = 1 << 0
+WALL_LEFT = 1 << 1
+WALL_RIGHT = 1 << 2
+WALL_TOP = 1 << 3
+WALL_BOTTOM = 1 << 4
+CORNER_TOP_LEFT = 1 << 5
+CORNER_TOP_RIGHT = 1 << 6
+CORNER_BOTTOM_LEFT = 1 << 7
+CORNER_BOTTOM_RIGHT = 1 << 8
+
+TABLE = types.Array(types.uint16, 2, "C")
+LEVEL = types.Array(types.uint8, 3, "C")
+PYRAMID = types.ListType(LEVEL)
+HEAT = types.Array(types.float32, 2, "C")
+PATH_INDEX = types.Tuple((
+    types.Array(types.float64, 2, "C"), types.int64, types.int64, types.int64, types.int64,
+    types.Array(types.int64, 1, "C"), types.Array(types.int64, 1, "C"),
+))
+
+SIGNATURES = {
+    "classify": [(maze,) for maze in MAZE_TYPES],
+    "base_level": [(maze,) for maze in MAZE_TYPES],
+    "downsample": [(LEVEL,)],
+    "index_path": [(POINT_F, POINT_F, PATH)],
+    "render": [
+        (TABLE, POINT, POINT_F, scale, POINT_F, POINT_F, PATH_INDEX, pyramid, heat, types.none)
+        for scale in SCALES for pyramid in (PYRAMID, types.none) for heat in (HEAT, types.none)
+    ],
+}
+
 
 @njit(cache=True)
 def place_dot(buf, p1, p2, u, v, color):
@@ -41,8 +78,19 @@ def place_color(buf, u, v, color):
         buf[u, v] = color
 
 
+@njit(cache=True)
+def clip_steps(a, da, lo, hi, first, last):
+    if da == 0:
+        return (first, last) if lo <= a <= hi else (1, 0)
+
+    t0 = (lo - a) / da
+    t1 = (hi - a) / da
+    return max(first, ceil(min(t0, t1))), min(last, floor(max(t0, t1)))
+
+
 @njit(cache=True)
 def draw_line(buf, p1, p2, width, color):
+    h, w, _ = buf.shape
     x1, y1 = p1
     x2, y2 = p2
 
@@ -55,103 +103,374 @@ def draw_line(buf, p1, p2, width, color):
 
     dx /= d
     dy /= d
-    v, u = x1, y1
-    for _ in range(d + 1):
+
+    first, last = clip_steps(x1, dx, -width - 1, w + width, 0, d)
+    first, last = clip_steps(y1, dy, -width - 1, h + width, first, last)
+
+    for k in range(first, last + 1):
+        v = x1 + k * dx
+        u = y1 + k * dy
         for i in range(-width, width + 1):
             if abs(dx) > abs(dy):
                 place_color(buf, round(u + i), round(v), color)
             else:
                 place_color(buf, round(u), round(v + i), color)
 
-        v += dx
-        u += dy
+
+@njit(cache=True, nogil=True)
+def index_path(start, end, path):
+    if start == EMPTY_POINT_F or end == EMPTY_POINT_F:
+        points = np.empty((0, 2))
+    else:
+        points = np.empty((path.shape[0] + 2, 2))
+        points[0, 0], points[0, 1] = start
+        points[1:-1] = path
+        points[-1, 0], points[-1, 1] = end
+
+    n = max(points.shape[0] - 1, 0)
+    if n == 0:
+        return points, 0, 0, 0, 0, np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    bounds = np.empty((n, 4), dtype=np.int64)
+    for k in range(n):
+        bounds[k, 0] = floor(min(points[k, 0], points[k + 1, 0]) / PATH_BUCKET)
+        bounds[k, 1] = floor(min(points[k, 1], points[k + 1, 1]) / PATH_BUCKET)
+        bounds[k, 2] = floor(max(points[k, 0], points[k + 1, 0]) / PATH_BUCKET)
+        bounds[k, 3] = floor(max(points[k, 1], points[k + 1, 1]) / PATH_BUCKET)
+
+    origin_x, origin_y = bounds[:, 0].min(), bounds[:, 1].min()
+    cols = bounds[:, 2].max() - origin_x + 1
+    rows = bounds[:, 3].max() - origin_y + 1
+
+    offsets = np.zeros(cols * rows + 1, dtype=np.int64)
+    for k in range(n):
+        for bx in range(bounds[k, 0] - origin_x, bounds[k, 2] - origin_x + 1):
+            for by in range(bounds[k, 1] - origin_y, bounds[k, 3] - origin_y + 1):
+                offsets[bx * rows + by + 1] += 1
+
+    offsets = np.cumsum(offsets)
+    fill = offsets[:-1].copy()
+    segments = np.empty(offsets[-1], dtype=np.int64)
+
+    for k in range(n):
+        for bx in range(bounds[k, 0] - origin_x, bounds[k, 2] - origin_x + 1):
+            for by in range(bounds[k, 1] - origin_y, bounds[k, 3] - origin_y + 1):
+                segments[fill[bx * rows + by]] = k
+                fill[bx * rows + by] += 1
+
+    return points, origin_x, origin_y, cols, rows, offsets, segments
+
+
+@njit(cache=True)
+def visible_segments(path_index, x0, y0, x1, y1):
+    points, origin_x, origin_y, cols, rows, offsets, segments = path_index
+
+    bx0 = max(floor(x0 / PATH_BUCKET) - origin_x, 0)
+    by0 = max(floor(y0 / PATH_BUCKET) - origin_y, 0)
+    bx1 = min(floor(x1 / PATH_BUCKET) - origin_x, cols - 1)
+    by1 = min(floor(y1 / PATH_BUCKET) - origin_y, rows - 1)
+
+    visible = []
+    for bx in range(bx0, bx1 + 1):
+        for by in range(by0, by1 + 1):
+            for k in segments[offsets[bx * rows + by]:offsets[bx * rows + by + 1]]:
+                sx = floor(min(points[k, 0], points[k + 1, 0]) / PATH_BUCKET) - origin_x
+                sy = floor(min(points[k, 1], points[k + 1, 1]) / PATH_BUCKET) - origin_y
+                if bx == max(bx0, sx) and by == max(by0, sy):
+                    visible.append(k)
+
+    return visible
+
+
+@njit(cache=True)
+def draw_path(buf, size, offset, scale, path_index, line_width):
+    w, h = size
+    points = path_index[0]
+    margin = (line_width + 1) / scale
+
+    x0, y0 = from_screen((0, 0), size, offset, scale)
+    x1, y1 = from_screen((w, h), size, offset, scale)
+    visible = visible_segments(path_index, x0 - margin, y0 - margin, x1 + margin, y1 + margin)
+
+    for k in visible:
+        p1 = to_screen((points[k, 0], points[k, 1]), size, offset, scale)
+        p2 = to_screen((points[k + 1, 0], points[k + 1, 1]), size, offset, scale)
+        draw_line(buf, p1, p2, line_width, COLOR_PATH)
+
+    return visible
+
+
+@njit(cache=True, parallel=True)
+def classify(maze):
+    width, height = maze_shape(maze)
+    table = np.zeros((width + 2, height + 2), dtype=np.uint16)
+
+    for i in prange(width + 2):
+        x = i - 1
+        for y in range(-1, height + 1):
+            c = is_walkable(maze, x, y)
+            l = is_walkable(maze, x - 1, y)
+            r = is_walkable(maze, x + 1, y)
+            t = is_walkable(maze, x, y - 1)
+            b = is_walkable(maze, x, y + 1)
+
+            mask = 0
+            if c:
+                mask |= WALKABLE
+            if c != l:
+                mask |= WALL_LEFT
+            if c != r:
+                mask |= WALL_RIGHT
+            if c != t:
+                mask |= WALL_TOP
+            if c != b:
+                mask |= WALL_BOTTOM
+            if (c + l + t + is_walkable(maze, x - 1, y - 1)) % 2 == 1:
+                mask |= CORNER_TOP_LEFT
+            if (c + r + t + is_walkable(maze, x + 1, y - 1)) % 2 == 1:
+                mask |= CORNER_TOP_RIGHT
+            if (c + l + b + is_walkable(maze, x - 1, y + 1)) % 2 == 1:
+                mask |= CORNER_BOTTOM_LEFT
+            if (c + r + b + is_walkable(maze, x + 1, y + 1)) % 2 == 1:
+                mask |= CORNER_BOTTOM_RIGHT
+
+            table[i, y + 1] = mask
+
+    return table
+
+
+@njit(cache=True)
+def tile_mask(table, x, y):
+    width, height = table.shape
+    if x < -1 or x >= width - 1 or y < -1 or y >= height - 1:
+        return 0
+    return table[x + 1, y + 1]
+
+
+@njit(cache=True)
+def screen_axis(length, offset, scale):
+    coords = (np.arange(length) - length / 2 + offset) / scale
+    tiles = np.floor(coords).astype(np.int64)
+    return coords, tiles, scale * (coords - tiles)
+
+
+@njit(cache=True, parallel=True)
+def base_level(maze):
+    width, height = maze_shape(maze)
+    w, h = (width + 1) // 2, (height + 1) // 2
+    level = np.zeros((w, h, 2), dtype=np.uint8)
+
+    for i in prange(w):
+        for j in range(h):
+            cover = 0
+            walls = 0
+            for x in range(2 * i, min(2 * i + 2, width)):
+                for y in range(2 * j, min(2 * j + 2, height)):
+                    tile = is_walkable(maze, x, y)
+                    cover += tile
+                    walls += (
+                        (tile != is_walkable(maze, x - 1, y)) +
+                        (tile != is_walkable(maze, x + 1, y)) +
+                        (tile != is_walkable(maze, x, y - 1)) +
+                        (tile != is_walkable(maze, x, y + 1))
+                    )
+
+            level[i, j, 0] = 255 * cover // 4
+            level[i, j, 1] = 255 * walls // 16
+
+    return level
+
+
+@njit(cache=True, parallel=True)
+def downsample(level):
+    width, height, _ = level.shape
+    w, h = (width + 1) // 2, (height + 1) // 2
+    out = np.zeros((w, h, 2), dtype=np.uint8)
+
+    for i in prange(w):
+        for j in range(h):
+            for c in range(2):
+                total = 0
+                for x in range(2 * i, min(2 * i + 2, width)):
+                    for y in range(2 * j, min(2 * j + 2, height)):
+                        total += level[x, y, c]
+                out[i, j, c] = (total + 2) // 4
+
+    return out
+
+
+def build_pyramid(maze):
+    pyramid = List([base_level(maze)])
+    while max(pyramid[-1].shape[:2]) > 1:
+        pyramid.append(downsample(pyramid[-1]))
+
+    return pyramid
+
+
+def heatmap(field):
+    reached = field >= 0
+    heat = np.full(field.shape, -1, dtype=np.float32)
+    heat[reached] = field[reached] / max(field.max(), 1)
+
+    return heat
+
+
+@njit(cache=True)
+def heat_at(heat, x, y):
+    if heat is None or x < 0 or x >= heat.shape[0] or y < 0 or y >= heat.shape[1]:
+        return -1.0
+    return heat[x, y]
+
+
+@njit(cache=True)
+def fill_color(t, c):
+    if t < 0:
+        return COLOR_FILL[c]
+    return HEAT_NEAR[c] + (HEAT_FAR[c] - HEAT_NEAR[c]) * t
 
 
 @njit(cache=True, parallel=True)
-def render(maze, size, offset, scale, start, end, path):
+def shade_lod(buf, pyramid, size, offset, scale, start, end, heat=None):
     w, h = size
-    buf = np.zeros((h, w, 3), dtype=np.uint8)
 
-    path_verts = set()
-    for x, y in path:
-        path_verts.add((x, y))
+    k = 0
+    while k < len(pyramid) - 1 and scale * 2 ** (k + 1) < 1:
+        k += 1
+
+    level = pyramid[k]
+    factor = 2 ** (k + 1)
+    level_w, level_h, _ = level.shape
+
+    for i in prange(h):
+        for j in range(w):
+            x, y = from_screen((j, i), size, offset, scale)
+
+            if place_dot(buf, (x, y), start, i, j, COLOR_START):
+                continue
+
+            if place_dot(buf, (x, y), end, i, j, COLOR_END):
+                continue
+
+            if buf[i, j, 0] > 0 or buf[i, j, 1] > 0 or buf[i, j, 2] > 0:
+                continue
+
+            cell_x, cell_y = floor(x / factor), floor(y / factor)
+            if cell_x < 0 or cell_x >= level_w or cell_y < 0 or cell_y >= level_h:
+                buf[i, j] = COLOR_BACKGROUND
+                continue
+
+            t = heat_at(heat, cell_x * factor, cell_y * factor)
+            cover = level[cell_x, cell_y, 0] / 255
+            walls = level[cell_x, cell_y, 1] / 255
+            for c in range(3):
+                color = COLOR_BACKGROUND[c] + (fill_color(t, c) - COLOR_BACKGROUND[c]) * cover
+                buf[i, j, c] = color + (COLOR_OUTLINE[c] - color) * walls
+
+
+@njit(cache=True)
+def frame_buffer(size, out):
+    w, h = size
+    if out is None:
+        return np.zeros((h, w, 3), dtype=np.uint8)
 
+    assert out.shape == (h, w, 3), "Output buffer doesn't match the size"
+    out[:] = 0
+    return out
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def render_lod(pyramid, size, offset, scale, start, end, path_index, heat=None, out=None):
+    buf = frame_buffer(size, out)
+
+    draw_path(buf, size, offset, scale, path_index, 1.0)
+    shade_lod(buf, pyramid, size, offset, scale, start, end, heat)
+
+    return buf
+
+
+@njit(cache=True)
+def line_style(scale):
     line_width = max(LINE_WIDTH * scale, 1)
     if LINE_WIDTH * scale < 1:
         line_color = (COLOR_FILL + (COLOR_OUTLINE - COLOR_FILL) * LINE_WIDTH * scale).astype(np.uint8)
     else:
         line_color = COLOR_OUTLINE.astype(np.uint8)
 
-    dot_radius_sqr = scale * scale * DOT_RADIUS * DOT_RADIUS
+    return line_width, line_color
 
-    path_screen = [to_screen(p, size, offset, scale) for p in path]
 
-    for i in prange(1, len(path)):
-        p1 = path_screen[i - 1]
-        p2 = path_screen[i] 
-        draw_line(buf, p1, p2, line_width, COLOR_PATH)
+@njit(cache=True, parallel=True)
+def shade(buf, table, size, offset, scale, start, end, points, visible, heat=None):
+    w, h = size
+    line_width, line_color = line_style(scale)
+    dot_radius_sqr = scale * scale * DOT_RADIUS * DOT_RADIUS
 
-    start_screen = to_screen(start, size, offset, scale)
-    end_screen = to_screen(end, size, offset, scale)
+    path_verts = set()
+    for k in visible:
+        for v in (k, k + 1):
+            if 0 < v < points.shape[0] - 1:
+                path_verts.add((int(points[v, 0]), int(points[v, 1])))
 
-    if len(path) > 0:
-        draw_line(buf, start_screen, path_screen[0], line_width, COLOR_PATH)
-        draw_line(buf, path_screen[-1], end_screen, line_width, COLOR_PATH)
-    elif start != EMPTY_POINT_F and end != EMPTY_POINT_F:
-        draw_line(buf, start_screen, end_screen, line_width, COLOR_PATH)
+    xs, tile_xs, xls = screen_axis(w, offset[0], scale)
+    ys, tile_ys, yls = screen_axis(h, offset[1], scale)
 
     for i in prange(h):
+        y, tile_y, yl = ys[i], tile_ys[i], yls[i]
+        yr = scale - yl - 1
+
+        near_start = start != EMPTY_POINT_F and abs(y - start[1]) < DOT_RADIUS
+        near_end = end != EMPTY_POINT_F and abs(y - end[1]) < DOT_RADIUS
+
         for j in range(w):
-            x, y = from_screen((j, i), size, offset, scale)
+            x, tile_x, xl = xs[j], tile_xs[j], xls[j]
+            xr = scale - xl - 1
 
-            if place_dot(buf, (x, y), start, i, j, COLOR_START):
+            if near_start and place_dot(buf, (x, y), start, i, j, COLOR_START):
                 continue
 
-            if place_dot(buf, (x, y), end, i, j, COLOR_END):
+            if near_end and place_dot(buf, (x, y), end, i, j, COLOR_END):
                 continue
 
             if buf[i, j, 0] > 0 or buf[i, j, 1] > 0 or buf[i, j, 2] > 0:
                 continue
 
-            tile_x, tile_y = floor(x), floor(y)
-            tiles = (
-                bound_check(maze, tile_x, tile_y),
-                bound_check(maze, tile_x - 1, tile_y),
-                bound_check(maze, tile_x + 1, tile_y),
-                bound_check(maze, tile_x, tile_y - 1),
-                bound_check(maze, tile_x, tile_y + 1),
-                bound_check(maze, tile_x + 1, tile_y + 1),
-                bound_check(maze, tile_x + 1, tile_y - 1),
-                bound_check(maze, tile_x - 1, tile_y - 1),
-                bound_check(maze, tile_x - 1, tile_y + 1)
-            )
-            
-            xl = scale * (x - tile_x)
-            yl = scale * (y - tile_y)
-            xr = scale - xl - 1
-            yr = scale - yl - 1
+            mask = tile_mask(table, tile_x, tile_y)
 
-            if xl * xl + yl * yl < dot_radius_sqr and (tiles[0] + tiles[1] + tiles[3] + tiles[7]) % 2 == 1:
+            if xl * xl + yl * yl < dot_radius_sqr and mask & CORNER_TOP_LEFT:
                 buf[i, j] = COLOR_PATH if (tile_x, tile_y) in path_verts else line_color
-            elif xr * xr + yl * yl < dot_radius_sqr and (tiles[0] + tiles[2] + tiles[3] + tiles[6]) % 2 == 1:
+            elif xr * xr + yl * yl < dot_radius_sqr and mask & CORNER_TOP_RIGHT:
                 buf[i, j] = COLOR_PATH if (tile_x + 1, tile_y) in path_verts else line_color
-            elif xl * xl + yr * yr < dot_radius_sqr and (tiles[0] + tiles[1] + tiles[4] + tiles[8]) % 2 == 1:
+            elif xl * xl + yr * yr < dot_radius_sqr and mask & CORNER_BOTTOM_LEFT:
                 buf[i, j] = COLOR_PATH if (tile_x, tile_y + 1) in path_verts else line_color
-            elif xr * xr + yr * yr < dot_radius_sqr and (tiles[0] + tiles[2] + tiles[4] + tiles[5]) % 2 == 1:
+            elif xr * xr + yr * yr < dot_radius_sqr and mask & CORNER_BOTTOM_RIGHT:
                 buf[i, j] = COLOR_PATH if (tile_x + 1, tile_y + 1) in path_verts else line_color
-            elif (xl < line_width) and (tiles[0] != tiles[1]):
+            elif (xl < line_width) and mask & WALL_LEFT:
                 buf[i, j] = line_color
-            elif (xr < line_width) and (tiles[0] != tiles[2]):
+            elif (xr < line_width) and mask & WALL_RIGHT:
                 buf[i, j] = line_color
-            elif (yl < line_width) and (tiles[0] != tiles[3]):
+            elif (yl < line_width) and mask & WALL_TOP:
                 buf[i, j] = line_color
-            elif (yr < line_width) and (tiles[0] != tiles[4]):
+            elif (yr < line_width) and mask & WALL_BOTTOM:
                 buf[i, j] = line_color
-            elif tiles[0]:
-                buf[i, j] = COLOR_FILL
+            elif mask & WALKABLE:
+                t = heat_at(heat, tile_x, tile_y)
+                for c in range(3):
+                    buf[i, j, c] = fill_color(t, c)
             else:
                 buf[i, j] = COLOR_BACKGROUND
-    
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def render(table, size, offset, scale, start, end, path_index, pyramid=None, heat=None, out=None):
+    if pyramid is not None and scale < LOD_SCALE:
+        return render_lod(pyramid, size, offset, scale, start, end, path_index, heat, out)
+
+    buf = frame_buffer(size, out)
+
+    line_width, _ = line_style(scale)
+    visible = draw_path(buf, size, offset, scale, path_index, line_width)
+    shade(buf, table, size, offset, scale, start, end, path_index[0], visible, heat)
+
     return buf
 
 
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from solver import get_endpoints, grow, make_taut, reconstruct, ROOT
+from util import maze_shape, EMPTY_POINT
+
+
+MEMORY_LIMIT = 256 << 20
+
+
+class SearchCache:
+    def __init__(self, memory_limit=MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.trees = OrderedDict()
+        self.memory = 0
+
+
+    def clear(self):
+        self.trees.clear()
+        self.memory = 0
+
+
+    def discard(self, key):
+        tree = self.trees.pop(key, None)
+        if tree is not None:
+            self.memory -= sum(a.nbytes for a in tree)
+
+
+    def tree(self, maze, key):
+        if key in self.trees:
+            self.trees.move_to_end(key)
+            return self.trees[key]
+
+        width, height = maze_shape(maze)
+        come_from = np.full((width, height), -1, dtype=np.int8)
+        queue = np.empty(width * height, dtype=np.int32 if width * height < 1 << 31 else np.int64)
+        for k, (x, y) in enumerate(key):
+            come_from[x, y] = ROOT
+            queue[k] = x * height + y
+
+        tree = [come_from, queue, np.array([0, len(key)], dtype=np.int64)]
+        self.trees[key] = tree
+        self.memory += sum(a.nbytes for a in tree)
+        while self.memory > self.memory_limit and len(self.trees) > 1:
+            self.discard(next(iter(self.trees)))
+
+        return tree
+
+
+    def solve(self, maze, start, end):
+        start_tiles, end_tiles = get_endpoints(maze, start, end)
+        start_key, end_key = tuple(sorted(start_tiles)), tuple(sorted(end_tiles))
+
+        reverse = start_key not in self.trees and end_key in self.trees
+        if reverse:
+            start, end = end, start
+            start_tiles, end_tiles = end_tiles, start_tiles
+            start_key, end_key = end_key, start_key
+
+        tree = self.tree(maze, start_key)
+        come_from, queue, bounds = tree
+        goal = grow(maze, come_from, queue, bounds, end_tiles)
+
+        if bounds[0] == bounds[1] and queue.size > 0:
+            self.memory -= queue.nbytes
+            tree[1] = np.empty(0, dtype=queue.dtype)
+
+        assert goal != EMPTY_POINT, "Maze isn't solvable"
+        dist, path = make_taut(reconstruct(come_from, start_tiles, goal), start, end)
+
+        if reverse:
+            path = path[::-1].copy()
+
+        return dist, path
@@ -0,0 +1,306 @@
+import argparse
+import io
+import json
+import os
+import threading
+
+import numpy as np
+
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+import instrument
+
+from kernels import build_index, index_path, solve, warm_up, ENGINES
+from mazefile import load_maze
+from renderer import build_pyramid, classify, render
+from solver import uses_levels
+from tilecache import TILE_SIZE
+from util import EMPTY_POINT_F
+
+
+HOST = "127.0.0.1"
+PORT = 8750
+BATCH_CHUNK = 64
+PATH_CACHE = 64
+
+LoadedMaze = namedtuple("LoadedMaze", ["maze", "info", "index", "table", "pyramid"])
+
+
+def preload(path):
+    maze, info = load_maze(path)
+    try:
+        index = build_index(maze)
+    except AssertionError:
+        index = None
+
+    return LoadedMaze(maze, info, index, classify(maze), build_pyramid(maze))
+
+
+def uses_parallel(loaded, engine):
+    return engine == "tunnel" and uses_levels(loaded.maze, loaded.index)
+
+
+def parse_point(value):
+    coords = value.split(",") if isinstance(value, str) else value
+    assert isinstance(coords, list) and len(coords) == 2, f"Invalid point {value!r}"
+    assert all(isinstance(c, (str, int, float)) and not isinstance(c, bool) for c in coords), f"Invalid point {value!r}"
+
+    try:
+        x, y = float(coords[0]), float(coords[1])
+    except OverflowError:
+        x = y = np.inf
+    assert np.isfinite(x) and np.isfinite(y), f"Invalid point {value!r}"
+
+    return x, y
+
+
+def parse_query(query):
+    assert isinstance(query, list) and len(query) == 2, f"Invalid query {query!r}"
+    return parse_point(query[0]), parse_point(query[1])
+
+
+def solve_query(loaded, start, end, engine):
+    dist, path = solve(loaded.maze, start, end, loaded.index, engine)
+    return {"distance": float(dist), "path": path.tolist()}
+
+
+def solve_chunk(loaded, queries, engine):
+    results = []
+    for start, end in queries:
+        try:
+            results.append(solve_query(loaded, start, end, engine))
+        except AssertionError as e:
+            results.append({"distance": None, "path": None, "error": str(e)})
+
+    return results
+
+
+class PathCache:
+    def __init__(self, size=PATH_CACHE):
+        self.size = size
+        self.paths = OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def path_index(self, name, loaded, start, end, engine):
+        key = (name, start, end, engine)
+        with self.lock:
+            if key in self.paths:
+                self.paths.move_to_end(key)
+                return self.paths[key]
+
+        _, path = solve(loaded.maze, start, end, loaded.index, engine)
+        path_index = index_path(start, end, path)
+
+        with self.lock:
+            self.paths[key] = path_index
+            while len(self.paths) > self.size:
+                self.paths.popitem(last=False)
+
+        return path_index
+
+
+def render_tile(paths, name, loaded, scale, tx, ty, start, end, engine):
+    if start is None or end is None:
+        start = end = EMPTY_POINT_F
+        path_index = index_path(start, end, np.empty((0, 2), dtype=np.uint32))
+    else:
+        path_index = paths.path_index(name, loaded, start, end, engine)
+
+    t = TILE_SIZE
+    buf = render(loaded.table, (t, t), (tx * t + t / 2, ty * t + t / 2), scale, start, end, path_index, loaded.pyramid)
+
+    out = io.BytesIO()
+    Image.fromarray(buf).save(out, "PNG")
+    return out.getvalue()
+
+
+class Pool:
+    def __init__(self, workers):
+        self.workers = workers
+        self.solvers = ThreadPoolExecutor(workers)
+        self.parallel = ThreadPoolExecutor(1)
+        self.pending = 0
+        self.lock = threading.Lock()
+
+
+    def run(self, executor, fn, *args):
+        with self.lock:
+            self.pending += 1
+            instrument.record("server.queue", self.pending)
+
+        def job():
+            with self.lock:
+                self.pending -= 1
+            return fn(*args)
+
+        return executor.submit(job)
+
+
+    def solve(self, parallel, fn, *args):
+        return self.run(self.parallel if parallel else self.solvers, fn, *args)
+
+
+    def render(self, fn, *args):
+        return self.run(self.parallel, fn, *args)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        self.handle_request(url.path, query)
+
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self.send_json(400, {"error": "Invalid JSON"})
+
+        if not isinstance(body, dict):
+            return self.send_json(400, {"error": "Body must be a JSON object"})
+
+        self.handle_request(urlparse(self.path).path, body)
+
+
+    def handle_request(self, path, params):
+        route = self.server.routes.get((self.command, path))
+        if route is None:
+            return self.send_json(404, {"error": f"No route {self.command} {path}"})
+
+        start = perf_counter()
+        try:
+            status, kind, body = route(self.server, params)
+        except KeyError as e:
+            status, kind, body = 400, "application/json", {"error": f"Missing {e}"}
+        except (AssertionError, ValueError) as e:
+            status, kind, body = 400, "application/json", {"error": str(e)}
+
+        if kind == "application/json":
+            self.send_json(status, body)
+        else:
+            self.send_body(status, kind, body)
+
+        instrument.record(f"server.{path.strip('/').replace('/', '.')}", perf_counter() - start)
+
+
+    def send_json(self, status, body):
+        self.send_body(status, "application/json", json.dumps(body).encode())
+
+
+    def send_body(self, status, kind, body):
+        self.send_response(status)
+        self.send_header("Content-Type", kind)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def query_target(server, params):
+    name = params["maze"]
+    engine = params.get("engine", "tunnel")
+    assert name in server.mazes, f"Unknown maze {name}"
+    assert engine in ENGINES, f"Unknown engine {engine}"
+
+    return server.mazes[name], engine
+
+
+def get_mazes(server, params):
+    mazes = {name: {"width": m.info.width, "height": m.info.height, "indexed": m.index is not None} for name, m in server.mazes.items()}
+    return 200, "application/json", mazes
+
+
+def get_stats(server, params):
+    stats = instrument.stats()
+    stats["queue"] = {"pending": server.pool.pending, "workers": server.pool.workers}
+    return 200, "application/json", stats
+
+
+def post_solve(server, params):
+    loaded, engine = query_target(server, params)
+
+    result = server.pool.solve(uses_parallel(loaded, engine), solve_query, loaded, parse_point(params["start"]), parse_point(params["end"]), engine).result()
+    return 200, "application/json", result
+
+
+def post_batch(server, params):
+    loaded, engine = query_target(server, params)
+
+    assert isinstance(params["queries"], list), "Queries must be a list"
+    queries = [parse_query(query) for query in params["queries"]]
+    parallel = uses_parallel(loaded, engine)
+    futures = [server.pool.solve(parallel, solve_chunk, loaded, queries[i:i + BATCH_CHUNK], engine) for i in range(0, len(queries), BATCH_CHUNK)]
+    return 200, "application/json", {"results": [result for future in futures for result in future.result()]}
+
+
+def get_tile(server, params):
+    loaded, engine = query_target(server, params)
+
+    start = parse_point(params["start"]) if "start" in params else None
+    end = parse_point(params["end"]) if "end" in params else None
+    scale = float(params.get("scale", 1))
+    assert scale > 0, "Scale must be positive"
+
+    png = server.pool.render(render_tile, server.paths, params["maze"], loaded, scale, int(params["x"]), int(params["y"]), start, end, engine).result()
+    return 200, "image/png", png
+
+
+ROUTES = {
+    ("GET", "/mazes"): get_mazes,
+    ("GET", "/stats"): get_stats,
+    ("POST", "/solve"): post_solve,
+    ("POST", "/solve/batch"): post_batch,
+    ("GET", "/tile"): get_tile,
+}
+
+
+class SolveServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, mazes, workers=None, verbose=False):
+        super().__init__(address, Handler)
+        self.mazes = mazes
+        self.pool = Pool(workers or os.cpu_count())
+        self.paths = PathCache()
+        self.routes = ROUTES
+        self.verbose = verbose
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve solves and tiles for preloaded maze files over HTTP")
+    parser.add_argument("mazes", nargs="+", help="maze files, served under their file name without the extension")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, help="solver threads, one per CPU by default")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    warm_up()
+    print(f"compiled kernels in {perf_counter() - start:.2f}s")
+
+    mazes = {}
+    for path in args.mazes:
+        name = os.path.splitext(os.path.basename(path))[0]
+        mazes[name] = preload(path)
+        print(f"loaded {name} ({mazes[name].info.width}x{mazes[name].info.height})")
+
+    server = SolveServer((args.host, args.port), mazes, args.workers, args.verbose)
+    print(f"listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,9 +1,30 @@
 import numpy as np
+import os
+import threading
 
-from numba import njit
+from numba import njit, prange, types
 from math import floor, ceil
+from concurrent.futures import ThreadPoolExecutor
 
-from util import bound_check, distance, empty_path
+from util import bound_check, distance, empty_path, is_walkable, maze_shape, EMPTY_POINT, MAZE_TYPES, POINT_F
+
+
+DX = np.array([-1, 0, 1, 0])
+DY = np.array([0, -1, 0, 1])
+
+CHUNKS_PER_WORKER = 4
+ROOT = 4
+PARALLEL_BFS_CELLS = 1 << 24
+PARALLEL_FRONTIER = 1 << 12
+
+INDEX = types.Tuple((types.Array(types.int8, 2, "C"), types.Array(types.int32, 2, "C")))
+
+SIGNATURES = {
+    "build_index": [(maze,) for maze in MAZE_TYPES],
+    "solve_maze": [(maze, POINT_F, POINT_F, index) for maze in MAZE_TYPES for index in (INDEX, types.none)],
+    "solve_levels": [(maze, POINT_F, POINT_F) for maze in MAZE_TYPES],
+    "distance_field": [(maze, POINT_F) for maze in MAZE_TYPES],
+}
 
 
 @njit(cache=True)
@@ -17,17 +38,6 @@ def get_tiles(vertex):
     return tiles
 
 
-@njit(cache=True)
-def get_vertices(tile):
-    x, y = tile
-    return [
-        (x, y),
-        (x + 1, y),
-        (x, y + 1),
-        (x + 1, y + 1)
-    ]
-
-
 @njit(cache=True)
 def colinear(a, b, c):
     xa, ya = a
@@ -38,96 +48,541 @@ def colinear(a, b, c):
 
 
 @njit(cache=True)
-def preprocess(maze, start, end):
-    visited = np.zeros(maze.shape, dtype=np.bool8)
-    come_from = np.full((*maze.shape, 2), -1)
+def append_walkable(walkable, p):
+    if len(walkable) > 1 and colinear(walkable[-2], walkable[-1], p):
+        walkable[-1] = p
+    else:
+        walkable.append(p)
+
+
+@njit(cache=True)
+def make_tunnel(walkable):
+    return np.array(walkable[::-1], dtype=np.uint32)
+
+
+@njit(cache=True)
+def climb(parent, p):
+    x, y = p
+    d = parent[x, y]
+    return x + DX[d], y + DY[d]
+
+
+@njit(cache=True)
+def flood(maze, start, end, visited, come_from):
     queue = [i for i in start]
     front = len(queue) - 1
+    goal = EMPTY_POINT
 
     while front < len(queue):
         x, y = queue[front]
         front += 1
 
         if (x, y) in end:
-            walkable = []
-
-            while not (x, y) in start:
-                if len(walkable) > 1 and colinear(walkable[-2], walkable[-1], (x, y)):
-                    walkable[-1] = (x, y)
-                else:
-                    walkable.append((x, y))
-                x, y = come_from[x, y]
-
-            if len(walkable) > 1 and colinear(walkable[-2], walkable[-1], (x, y)):
-                walkable[-1] = (x, y)
-            else:
-                walkable.append((x, y))
-
-            if len(walkable) <= 2:
-                return empty_path()
-            
-            return np.array(walkable[-2:0:-1], dtype=np.uint32)
-            
-    
-        for i, j in [(x - 1, y), (x, y - 1), (x + 1, y), (x, y + 1)]:
-            if bound_check(maze, i, j) and not bound_check(visited, i, j):
+            goal = (x, y)
+            break
+
+        for d in range(4):
+            i = x + DX[d]
+            j = y + DY[d]
+            if is_walkable(maze, i, j) and not bound_check(visited, i, j):
                 visited[i, j] = True
-                come_from[i, j] = [x, y]
+                come_from[i, j] = d ^ 2
                 queue.append((i, j))
 
-    assert False, "Maze isn't solvable"
+    for i, j in queue:
+        visited[i, j] = False
+
+    return goal, len(queue)
+
+
+@njit(cache=True)
+def reconstruct(come_from, start, goal):
+    x, y = goal
+    walkable = [(x, y)]
+
+    while not (x, y) in start:
+        x, y = climb(come_from, (x, y))
+        append_walkable(walkable, (x, y))
+
+    return make_tunnel(walkable)
+
+
+@njit(cache=True)
+def search(maze, start, end, visited, come_from):
+    goal, _ = flood(maze, start, end, visited, come_from)
+    assert goal != EMPTY_POINT, "Maze isn't solvable"
+    return reconstruct(come_from, start, goal)
+
+
+@njit(cache=True)
+def grow(maze, come_from, queue, bounds, end):
+    for x, y in end:
+        if come_from[x, y] >= 0:
+            return (x, y)
+
+    _, height = maze_shape(maze)
+    front, back = bounds
+    goal = EMPTY_POINT
+
+    while front < back and goal == EMPTY_POINT:
+        x, y = divmod(np.int64(queue[front]), height)
+        front += 1
+
+        for d in range(4):
+            i = x + DX[d]
+            j = y + DY[d]
+            if is_walkable(maze, i, j) and come_from[i, j] < 0:
+                come_from[i, j] = d ^ 2
+                queue[back] = i * height + j
+                back += 1
+                if (i, j) in end:
+                    goal = (i, j)
+
+    bounds[0], bounds[1] = front, back
+    return goal
+
+
+@njit(cache=True)
+def bfs_tree(maze, start):
+    width, height = maze_shape(maze)
+    come_from = np.full((width, height), -1, dtype=np.int8)
+    hops = np.full((width, height), -1, dtype=np.int32)
+    queue = np.empty(width * height, dtype=np.int64)
+
+    for k, (x, y) in enumerate(start):
+        come_from[x, y] = ROOT
+        hops[x, y] = 0
+        queue[k] = x * height + y
+
+    front = 0
+    back = len(start)
+
+    while front < back:
+        x, y = divmod(queue[front], height)
+        front += 1
+
+        for d in range(4):
+            i = x + DX[d]
+            j = y + DY[d]
+            if is_walkable(maze, i, j) and come_from[i, j] < 0:
+                come_from[i, j] = d ^ 2
+                hops[i, j] = hops[x, y] + 1
+                queue[back] = i * height + j
+                back += 1
+
+    return come_from, hops
+
+
+@njit(cache=True)
+def first_claim(order, x, y, front, back):
+    width, height = order.shape
+    owner = back
+    for d in range(4):
+        i = x + DX[d]
+        j = y + DY[d]
+        if i >= 0 and i < width and j >= 0 and j < height and front <= order[i, j] < owner:
+            owner = order[i, j]
+
+    return owner
+
+
+@njit(cache=True, parallel=True)
+def level_flood(maze, start, end, come_from, order, queue, min_frontier=PARALLEL_FRONTIER):
+    _, height = maze_shape(maze)
+    x, y = start[-1]
+    order[x, y] = 0
+    queue[0] = x * height + y
+    front, back = 0, 1
+
+    while front < back:
+        goal = EMPTY_POINT
+        first = back
+        for x, y in end:
+            if front <= order[x, y] < first:
+                goal = (x, y)
+                first = order[x, y]
+        if goal != EMPTY_POINT:
+            return goal, back
+
+        n = back - front
+        if n < min_frontier:
+            for k in range(front, n + front):
+                x, y = divmod(np.int64(queue[k]), height)
+                for d in range(4):
+                    i = x + DX[d]
+                    j = y + DY[d]
+                    if is_walkable(maze, i, j) and order[i, j] < 0:
+                        order[i, j] = back
+                        come_from[i, j] = d ^ 2
+                        queue[back] = i * height + j
+                        back += 1
+
+            front += n
+            continue
+
+        claims = np.zeros(n, dtype=np.uint8)
+        counts = np.zeros(n + 1, dtype=np.int64)
+        for k in prange(n):
+            x, y = divmod(np.int64(queue[front + k]), height)
+            for d in range(4):
+                i = x + DX[d]
+                j = y + DY[d]
+                if is_walkable(maze, i, j) and order[i, j] < 0 and first_claim(order, i, j, front, back) == front + k:
+                    claims[k] |= 1 << d
+                    counts[k + 1] += 1
+
+        offsets = np.cumsum(counts)
+        for k in prange(n):
+            x, y = divmod(np.int64(queue[front + k]), height)
+            pos = back + offsets[k]
+            for d in range(4):
+                if claims[k] >> d & 1:
+                    i = x + DX[d]
+                    j = y + DY[d]
+                    order[i, j] = pos
+                    come_from[i, j] = d ^ 2
+                    queue[pos] = i * height + j
+                    pos += 1
+
+        front = back
+        back += offsets[n]
+
+    return EMPTY_POINT, back
+
+
+@njit(cache=True)
+def level_search(maze, start, end, min_frontier=PARALLEL_FRONTIER):
+    width, height = maze_shape(maze)
+    come_from = np.empty((width, height), dtype=np.int8)
+
+    if width * height < 1 << 31:
+        order = np.full((width, height), -1, dtype=np.int32)
+        queue = np.empty(width * height, dtype=np.int32)
+        goal, _ = level_flood(maze, start, end, come_from, order, queue, min_frontier)
+    else:
+        order = np.full((width, height), -1, dtype=np.int64)
+        queue = np.empty(width * height, dtype=np.int64)
+        goal, _ = level_flood(maze, start, end, come_from, order, queue, min_frontier)
+
+    assert goal != EMPTY_POINT, "Maze isn't solvable"
+    return reconstruct(come_from, start, goal)
+
+
+def uses_levels(maze, index=None):
+    width, height = maze_shape(maze)
+    return index is None and width * height >= PARALLEL_BFS_CELLS
+
+
+@njit(cache=True)
+def preprocess(maze, start, end):
+    visited = np.zeros(maze_shape(maze), dtype=np.bool8)
+    come_from = np.empty(maze_shape(maze), dtype=np.int8)
+    return search(maze, start, end, visited, come_from)
+
+
+@njit(cache=True)
+def build_index(maze):
+    width, height = maze_shape(maze)
+    parent = np.full((width, height), -1, dtype=np.int8)
+    depth = np.full((width, height), -1, dtype=np.int32)
+    queue = np.empty(width * height, dtype=np.int64)
+
+    nodes = 0
+    for x in range(width):
+        for y in range(height):
+            if is_walkable(maze, x, y):
+                if nodes == 0:
+                    depth[x, y] = 0
+                    queue[0] = x * height + y
+                nodes += 1
+
+    assert nodes > 0, "Maze is empty"
+
+    front = 0
+    back = 1
+
+    while front < back:
+        x, y = divmod(queue[front], height)
+        front += 1
+
+        for d in range(4):
+            i = x + DX[d]
+            j = y + DY[d]
+            if d == parent[x, y] or not is_walkable(maze, i, j):
+                continue
+
+            assert depth[i, j] < 0, "Maze isn't a tree"
+            depth[i, j] = depth[x, y] + 1
+            parent[i, j] = d ^ 2
+            queue[back] = i * height + j
+            back += 1
+
+    assert back == nodes, "Maze isn't solvable"
+    return parent, depth
+
+
+@njit(cache=True)
+def lowest_ancestor(index, a, b):
+    parent, depth = index
+
+    while depth[a] > depth[b]:
+        a = climb(parent, a)
+    while depth[b] > depth[a]:
+        b = climb(parent, b)
+    while a != b:
+        a = climb(parent, a)
+        b = climb(parent, b)
+
+    return a
+
+
+@njit(cache=True)
+def tree_tunnel(index, start, end):
+    parent, depth = index
+
+    s, e = start[0], end[0]
+    top = lowest_ancestor(index, s, e)
+    best = depth[s] + depth[e] - 2 * depth[top]
+
+    for i in start:
+        for j in end:
+            k = lowest_ancestor(index, i, j)
+            d = depth[i] + depth[j] - 2 * depth[k]
+            if d < best:
+                s, e, top, best = i, j, k, d
+
+    walkable = [e]
+    while e != top:
+        e = climb(parent, e)
+        append_walkable(walkable, e)
+
+    branch = []
+    while s != top:
+        branch.append(s)
+        s = climb(parent, s)
+
+    for i in range(len(branch) - 1, -1, -1):
+        append_walkable(walkable, branch[i])
+
+    return make_tunnel(walkable)
+
+
+@njit(cache=True)
+def cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+@njit(cache=True)
+def portal(prev, tile, next):
+    x, y = np.int64(tile[0]), np.int64(tile[1])
+    ex, ey = np.sign(x - np.int64(prev[0])), np.sign(y - np.int64(prev[1]))
+    ox, oy = np.sign(np.int64(next[0]) - x), np.sign(np.int64(next[1]) - y)
+
+    inner = (float(x + (1 - ex + ox) // 2), float(y + (1 - ey + oy) // 2))
+    outer = (float(x + (1 + ex - ox) // 2), float(y + (1 + ey - oy) // 2))
+
+    if ex * oy - ey * ox > 0:
+        return inner, outer
+    return outer, inner
+
+
+@njit(cache=True)
+def push_left(funnel, bounds, path, p):
+    lo, apex, hi = bounds
+
+    while lo < apex and cross(funnel[lo + 1], funnel[lo], p) <= 0:
+        lo += 1
+
+    if lo == apex:
+        while apex < hi and cross(funnel[apex], funnel[apex + 1], p) < 0:
+            apex += 1
+            path.append((funnel[apex, 0], funnel[apex, 1]))
+        lo = apex
+
+    lo -= 1
+    funnel[lo] = p
+    bounds[0], bounds[1], bounds[2] = lo, apex, hi
+
+
+@njit(cache=True)
+def push_right(funnel, bounds, path, p):
+    lo, apex, hi = bounds
+
+    while hi > apex and cross(funnel[hi - 1], funnel[hi], p) >= 0:
+        hi -= 1
+
+    if hi == apex:
+        while apex > lo and cross(funnel[apex], funnel[apex - 1], p) > 0:
+            apex -= 1
+            path.append((funnel[apex, 0], funnel[apex, 1]))
+        hi = apex
+
+    hi += 1
+    funnel[hi] = p
+    bounds[0], bounds[1], bounds[2] = lo, apex, hi
 
 
 @njit(cache=True)
 def make_taut(seq, start, end):
-    if seq.shape[0] == 0:
+    start = (float(start[0]), float(start[1]))
+    end = (float(end[0]), float(end[1]))
+    n = seq.shape[0]
+    if n <= 2:
         return distance(start, end), empty_path()
-    
-    verts = [get_vertices(i) for i in seq]
-    come_from = np.full((seq.shape[0], 4), -1)
-    dists = np.full((seq.shape[0], 4), np.inf)
-
-    for i in range(4):
-        dists[0, i] = distance(start, verts[0][i])
-
-    for i in range(1, seq.shape[0]):
-        for j in range(4):
-            p = verts[i][j]
-            for k in range(4):
-                d = dists[i - 1, k] + distance(p, verts[i - 1][k])
-                if d < dists[i, j]:
-                    dists[i, j] = d
-                    come_from[i, j] = k
-
-    come_from_end = -1
-    dist_end = np.inf
-
-    for i in range(4):
-        d = dists[-1, i] + distance(verts[-1][i], end)
-        if d < dist_end:
-            dist_end = d
-            come_from_end = i
-    
-    path = []
-    i = seq.shape[0] - 1
-    j = come_from_end
-
-    while i > 0:
-        path.append(verts[i][j])
-        j = come_from[i, j]
-        i -= 1
-    
-    path.append(verts[i][j])
-    return dist_end, np.array(path[::-1], dtype=np.uint32)
-
-
-@njit(cache=True)
-def solve_maze(maze, start, end):
-    start_tiles = [(i, j) for i, j in get_tiles(start) if bound_check(maze, i, j)]
-    end_tiles = [(i, j) for i, j in get_tiles(end) if bound_check(maze, i, j)]
+
+    funnel = np.empty((2 * n + 1, 2))
+    funnel[n] = start
+    bounds = np.array([n, n, n])
+    path = [start]
+
+    for i in range(1, n - 1):
+        left, right = portal(seq[i - 1], seq[i], seq[i + 1])
+        push_left(funnel, bounds, path, left)
+        push_right(funnel, bounds, path, right)
+
+    push_left(funnel, bounds, path, end)
+    lo, apex, _ = bounds
+    for i in range(apex - 1, lo, -1):
+        path.append((funnel[i, 0], funnel[i, 1]))
+    path.append(end)
+
+    dist = 0.0
+    verts = np.empty((len(path) - 2, 2), dtype=np.uint32)
+    for i in range(1, len(path)):
+        dist += distance(path[i - 1], path[i])
+        if i < len(path) - 1:
+            verts[i - 1] = path[i]
+
+    return dist, verts
+
+
+@njit(cache=True)
+def get_endpoints(maze, start, end):
+    start_tiles = [(i, j) for i, j in get_tiles(start) if is_walkable(maze, i, j)]
+    end_tiles = [(i, j) for i, j in get_tiles(end) if is_walkable(maze, i, j)]
 
     assert len(start_tiles) > 0, "Start not in maze"
     assert len(end_tiles) > 0, "End not in maze"
 
-    tunnel = preprocess(maze, start_tiles, end_tiles)
+    return start_tiles, end_tiles
+
+
+@njit(cache=True, nogil=True)
+def solve_maze(maze, start, end, index=None):
+    start_tiles, end_tiles = get_endpoints(maze, start, end)
+
+    if index is None:
+        tunnel = preprocess(maze, start_tiles, end_tiles)
+    else:
+        tunnel = tree_tunnel(index, start_tiles, end_tiles)
+
     return make_taut(tunnel, start, end)
+
+
+@njit(cache=True, nogil=True)
+def solve_levels(maze, start, end):
+    start_tiles, end_tiles = get_endpoints(maze, start, end)
+    return make_taut(level_search(maze, start_tiles, end_tiles), start, end)
+
+
+@njit(cache=True, nogil=True)
+def solve_one_to_many(maze, source, targets, index=None):
+    start_tiles = [(i, j) for i, j in get_tiles(source) if is_walkable(maze, i, j)]
+    assert len(start_tiles) > 0, "Start not in maze"
+
+    if index is None:
+        come_from, _ = bfs_tree(maze, start_tiles)
+
+    n = targets.shape[0]
+    dists = np.full(n, np.inf)
+
+    for k in range(n):
+        target = (targets[k, 0], targets[k, 1])
+        end_tiles = [(i, j) for i, j in get_tiles(target) if is_walkable(maze, i, j)]
+        if len(end_tiles) == 0:
+            continue
+
+        if index is None:
+            goal = EMPTY_POINT
+            for x, y in end_tiles:
+                if come_from[x, y] >= 0:
+                    goal = (x, y)
+                    break
+
+            if goal == EMPTY_POINT:
+                continue
+
+            tunnel = reconstruct(come_from, start_tiles, goal)
+        else:
+            tunnel = tree_tunnel(index, start_tiles, end_tiles)
+
+        dists[k], _ = make_taut(tunnel, source, target)
+
+    return dists
+
+
+@njit(cache=True, nogil=True)
+def distance_field(maze, source):
+    start_tiles = [(i, j) for i, j in get_tiles(source) if is_walkable(maze, i, j)]
+    assert len(start_tiles) > 0, "Start not in maze"
+
+    _, hops = bfs_tree(maze, start_tiles)
+    return hops
+
+
+@njit(cache=True, nogil=True)
+def solve_chunk(maze, starts, ends, index, visited, come_from):
+    n = starts.shape[0]
+    dists = np.empty(n)
+    lengths = np.empty(n, dtype=np.int64)
+    paths = []
+
+    for k in range(n):
+        start = (starts[k, 0], starts[k, 1])
+        end = (ends[k, 0], ends[k, 1])
+        start_tiles, end_tiles = get_endpoints(maze, start, end)
+
+        if index is None:
+            tunnel = search(maze, start_tiles, end_tiles, visited, come_from)
+        else:
+            tunnel = tree_tunnel(index, start_tiles, end_tiles)
+
+        dists[k], path = make_taut(tunnel, start, end)
+        lengths[k] = path.shape[0]
+        paths.append(path)
+
+    verts = np.empty((lengths.sum(), 2), dtype=np.uint32)
+    offset = 0
+    for path in paths:
+        verts[offset:offset + path.shape[0]] = path
+        offset += path.shape[0]
+
+    return dists, lengths, verts
+
+
+def solve_many(maze, starts, ends, index=None, workers=None):
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    assert starts.shape == ends.shape, "Starts and ends differ in length"
+
+    workers = workers or os.cpu_count()
+    bounds = np.linspace(0, starts.shape[0], workers * CHUNKS_PER_WORKER + 1).astype(np.int64)
+    scratch = threading.local()
+
+    def run(lo, hi):
+        if not hasattr(scratch, "visited"):
+            shape = maze_shape(maze) if index is None else (0, 0)
+            scratch.visited = np.zeros(shape, dtype=np.bool8)
+            scratch.come_from = np.empty(shape, dtype=np.int8)
+
+        return solve_chunk(maze, starts[lo:hi], ends[lo:hi], index, scratch.visited, scratch.come_from)
+
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(run, bounds[:-1], bounds[1:]))
+
+    dists = np.concatenate([r[0] for r in results])
+    offsets = np.zeros(starts.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.concatenate([r[1] for r in results]), out=offsets[1:])
+    verts = np.concatenate([r[2] for r in results])
+
+    return dists, offsets, verts
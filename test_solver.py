@@ -0,0 +1,29 @@
+import numpy as np
+
+from generator import create_maze
+from solver import build_index, solve_maze, solve_one_to_many
+
+
+def test_integer_endpoints():
+    maze = create_maze(50, 40, 0.1, 1)
+    w, h = maze.shape
+
+    dist, path = solve_maze(maze, (1, 1), (w - 1, h - 1))
+    expected, expected_path = solve_maze(maze, (1.0, 1.0), (w - 1.0, h - 1.0))
+
+    assert dist == expected
+    assert np.array_equal(path, expected_path)
+
+
+def test_targets_in_walls():
+    maze = create_maze(50, 40, 0.1, 1)
+    w, h = maze.shape
+    xs, ys = np.nonzero(~maze)
+
+    source = (1.0, 1.0)
+    targets = np.array([(w - 1.0, h - 1.0), (xs[0] + 0.5, ys[0] + 0.5)])
+
+    for index in (None, build_index(maze)):
+        dists = solve_one_to_many(maze, source, targets, index)
+        assert dists[0] == solve_maze(maze, source, tuple(targets[0]))[0]
+        assert dists[1] == np.inf
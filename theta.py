@@ -0,0 +1,277 @@
+import numpy as np
+
+from numba import njit
+from math import floor, ceil
+
+from solver import get_endpoints
+from util import distance, empty_path, is_walkable, maze_shape, MAZE_TYPES, POINT_F
+
+
+HEAP_SIZE = 1024
+MAX_CORNERS = 9
+
+SIGNATURES = {
+    "solve_theta": [(maze, POINT_F, POINT_F) for maze in MAZE_TYPES],
+}
+
+
+@njit(cache=True)
+def heap_push(heap, size, key, item):
+    n = size[0]
+    if n == heap.shape[0]:
+        heap = np.concatenate((heap, np.empty_like(heap)))
+
+    entry = np.uint64(np.float32(key).view(np.uint32)) << np.uint64(32) | np.uint64(item)
+    while n > 0:
+        parent = (n - 1) // 2
+        if heap[parent] <= entry:
+            break
+        heap[n] = heap[parent]
+        n = parent
+
+    heap[n] = entry
+    size[0] += 1
+
+    return heap
+
+
+@njit(cache=True)
+def heap_pop(heap, size):
+    item = heap[0] & np.uint64(0xFFFFFFFF)
+    size[0] -= 1
+    n = size[0]
+    last = heap[n]
+
+    i = 0
+    while 2 * i + 1 < n:
+        child = 2 * i + 1
+        if child + 1 < n and heap[child + 1] < heap[child]:
+            child += 1
+        if heap[child] >= last:
+            break
+        heap[i] = heap[child]
+        i = child
+
+    heap[i] = last
+
+    return np.int64(item)
+
+
+@njit(cache=True)
+def first_cell(a, d):
+    return floor(a) if d > 0 else ceil(a) - 1
+
+
+@njit(cache=True)
+def axis_cell(maze, across, along, flip):
+    return is_walkable(maze, along, across) if flip else is_walkable(maze, across, along)
+
+
+@njit(cache=True)
+def axis_sight(maze, c, a, b, flip):
+    s = 1 if b > a else -1
+    lo = hi = floor(c)
+    if c == lo:
+        lo -= 1
+
+    prev_lo = prev_hi = True
+    for k in range(first_cell(a, s), first_cell(b, -s) + s, s):
+        walk_lo = axis_cell(maze, lo, k, flip)
+        walk_hi = axis_cell(maze, hi, k, flip)
+        if not ((walk_lo and prev_lo) or (walk_hi and prev_hi)):
+            return False
+        prev_lo, prev_hi = walk_lo, walk_hi
+
+    return True
+
+
+@njit(cache=True)
+def line_of_sight(maze, a, b):
+    ax, ay = a
+    bx, by = b
+    dx = bx - ax
+    dy = by - ay
+
+    if dx == 0 and dy == 0:
+        return True
+    if dx == 0:
+        return axis_sight(maze, ax, ay, by, False)
+    if dy == 0:
+        return axis_sight(maze, ay, ax, bx, True)
+
+    sx = 1 if dx > 0 else -1
+    sy = 1 if dy > 0 else -1
+    cx, cy = first_cell(ax, sx), first_cell(ay, sy)
+    ex, ey = first_cell(bx, -sx), first_cell(by, -sy)
+
+    adx, ady = abs(dx), abs(dy)
+    error = abs(cx + (sx > 0) - ax) * ady - abs(cy + (sy > 0) - ay) * adx
+
+    while True:
+        if not is_walkable(maze, cx, cy):
+            return False
+        if cx == ex and cy == ey:
+            return True
+
+        if cy == ey or (cx != ex and error < 0):
+            cx += sx
+            error += ady
+        elif cx == ex or error > 0:
+            cy += sy
+            error -= adx
+        else:
+            if not is_walkable(maze, cx + sx, cy) and not is_walkable(maze, cx, cy + sy):
+                return False
+            cx += sx
+            cy += sy
+            error += ady - adx
+
+
+@njit(cache=True)
+def corner_ids(tiles, height, out):
+    count = 0
+    for x, y in tiles:
+        for cx in (x, x + 1):
+            for cy in (y, y + 1):
+                u = cx * (height + 1) + cy
+                if u not in out[:count]:
+                    out[count] = u
+                    count += 1
+
+
+@njit(cache=True)
+def node_point(v, height, n, start, end):
+    if v == n:
+        return start
+    if v == n + 1:
+        return end
+
+    x, y = divmod(v, height + 1)
+    return float(x), float(y)
+
+
+@njit(cache=True)
+def neighbors(maze, v, ends, out):
+    width, height = maze_shape(maze)
+    n = (width + 1) * (height + 1)
+
+    count = 0
+    if v >= n:
+        for u in ends[v - n]:
+            if u >= 0:
+                out[count] = u
+                count += 1
+        return count
+
+    x, y = divmod(v, height + 1)
+    top_left = is_walkable(maze, x - 1, y - 1)
+    top_right = is_walkable(maze, x, y - 1)
+    bottom_left = is_walkable(maze, x - 1, y)
+    bottom_right = is_walkable(maze, x, y)
+
+    for dx, dy, clear in (
+        (-1, -1, top_left),
+        (1, -1, top_right),
+        (-1, 1, bottom_left),
+        (1, 1, bottom_right),
+        (-1, 0, top_left or bottom_left),
+        (1, 0, top_right or bottom_right),
+        (0, -1, top_left or top_right),
+        (0, 1, bottom_left or bottom_right),
+    ):
+        if clear:
+            out[count] = (x + dx) * (height + 1) + y + dy
+            count += 1
+
+    for k in range(2):
+        if v in ends[k]:
+            out[count] = n + k
+            count += 1
+
+    return count
+
+
+@njit(cache=True)
+def lazy_theta(maze, start, end):
+    start_tiles, end_tiles = get_endpoints(maze, start, end)
+    if line_of_sight(maze, start, end):
+        return distance(start, end), empty_path(), 0
+
+    width, height = maze_shape(maze)
+    n = (width + 1) * (height + 1)
+    source, goal = n, n + 1
+
+    ends = np.full((2, MAX_CORNERS), -1, dtype=np.int64)
+    corner_ids(start_tiles, height, ends[0])
+    corner_ids(end_tiles, height, ends[1])
+
+    g = np.full(n + 2, np.inf)
+    parent = np.full(n + 2, -1, dtype=np.int64)
+    closed = np.zeros(n + 2, dtype=np.bool8)
+    out = np.empty(8 + 2 * MAX_CORNERS, dtype=np.int64)
+
+    heap = np.empty(HEAP_SIZE, dtype=np.uint64)
+    size = np.zeros(1, dtype=np.int64)
+
+    g[source] = 0
+    parent[source] = source
+    heap = heap_push(heap, size, distance(start, end), source)
+
+    expanded = 0
+    found = False
+    while size[0] > 0:
+        v = heap_pop(heap, size)
+        if closed[v]:
+            continue
+
+        p = node_point(v, height, n, start, end)
+        if parent[v] != v and not line_of_sight(maze, node_point(parent[v], height, n, start, end), p):
+            g[v] = np.inf
+            for k in range(neighbors(maze, v, ends, out)):
+                u = out[k]
+                if closed[u]:
+                    cost = g[u] + distance(node_point(u, height, n, start, end), p)
+                    if cost < g[v]:
+                        g[v] = cost
+                        parent[v] = u
+
+        if v == goal:
+            found = True
+            break
+
+        closed[v] = True
+        expanded += 1
+
+        base = parent[v]
+        base_point = node_point(base, height, n, start, end)
+        for k in range(neighbors(maze, v, ends, out)):
+            u = out[k]
+            if closed[u]:
+                continue
+
+            q = node_point(u, height, n, start, end)
+            cost = g[base] + distance(base_point, q)
+            if cost < g[u]:
+                g[u] = cost
+                parent[u] = base
+                heap = heap_push(heap, size, cost + distance(q, end), u)
+
+    assert found, "Maze isn't solvable"
+
+    verts = []
+    v = parent[goal]
+    while v != source:
+        verts.append(v)
+        v = parent[v]
+
+    path = np.empty((len(verts), 2), dtype=np.uint32)
+    for k, v in enumerate(verts[::-1]):
+        path[k] = divmod(v, height + 1)
+
+    return g[goal], path, expanded
+
+
+@njit(cache=True, nogil=True)
+def solve_theta(maze, start, end):
+    dist, path, _ = lazy_theta(maze, start, end)
+    return dist, path
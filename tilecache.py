@@ -0,0 +1,93 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from instrument import render
+from renderer import LINE_WIDTH, DOT_RADIUS
+from util import EMPTY_POINT_F
+
+
+TILE_SIZE = 256
+MEMORY_LIMIT = 64 << 20
+
+
+def overlay_boxes(start, end, path_index):
+    dots = np.array([(x, y, x, y) for x, y in (start, end) if (x, y) != EMPTY_POINT_F], dtype=np.float64).reshape(-1, 4)
+    line = path_index[0]
+    segments = np.hstack((np.minimum(line[:-1], line[1:]), np.maximum(line[:-1], line[1:])))
+
+    return np.vstack((dots, segments))
+
+
+class TileCache:
+    def __init__(self, tile_size=TILE_SIZE, memory_limit=MEMORY_LIMIT):
+        self.tile_size = tile_size
+        self.memory_limit = memory_limit
+        self.tiles = OrderedDict()
+        self.memory = 0
+
+
+    def clear(self):
+        self.tiles.clear()
+        self.memory = 0
+
+
+    def discard(self, key):
+        tile = self.tiles.pop(key, None)
+        if tile is not None:
+            self.memory -= tile.nbytes
+
+
+    def tile(self, table, scale, tx, ty, start, end, path_index, pyramid=None, heat=None):
+        key = (scale, tx, ty)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        t = self.tile_size
+        tile = render(table, (t, t), (tx * t + t / 2, ty * t + t / 2), scale, start, end, path_index, pyramid, heat)
+
+        self.tiles[key] = tile
+        self.memory += tile.nbytes
+        while self.memory > self.memory_limit and len(self.tiles) > 1:
+            _, old = self.tiles.popitem(last=False)
+            self.memory -= old.nbytes
+
+        return tile
+
+
+    def render(self, table, size, offset, scale, start, end, path_index, pyramid=None, heat=None, out=None):
+        w, h = size
+        t = self.tile_size
+        left = round(offset[0] - w / 2)
+        top = round(offset[1] - h / 2)
+
+        buf = np.empty((h, w, 3), dtype=np.uint8) if out is None else out
+
+        for ty in range(top // t, (top + h - 1) // t + 1):
+            for tx in range(left // t, (left + w - 1) // t + 1):
+                tile = self.tile(table, scale, tx, ty, start, end, path_index, pyramid, heat)
+
+                x0, x1 = max(tx * t, left), min((tx + 1) * t, left + w)
+                y0, y1 = max(ty * t, top), min((ty + 1) * t, top + h)
+                buf[y0 - top:y1 - top, x0 - left:x1 - left] = tile[y0 - ty * t:y1 - ty * t, x0 - tx * t:x1 - tx * t]
+
+        return buf
+
+
+    def invalidate(self, start, end, path_index):
+        boxes = overlay_boxes(start, end, path_index)
+        if len(boxes) == 0:
+            return
+
+        for key in list(self.tiles):
+            scale, tx, ty = key
+            margin = (max(LINE_WIDTH * scale, 1) + DOT_RADIUS * scale + 2) / scale
+            size = self.tile_size / scale
+
+            x0, y0 = tx * size - margin, ty * size - margin
+            x1, y1 = (tx + 1) * size + margin, (ty + 1) * size + margin
+
+            hit = (boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0)
+            if hit.any():
+                self.discard(key)
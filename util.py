@@ -1,10 +1,27 @@
-from numba import njit
+from numba import njit, types
+from numba.extending import overload
 
 import numpy as np
 
+from packed import packed_shape, packed_walkable
+
 EMPTY_POINT = (-1, -1)
 EMPTY_POINT_F = (-1., -1.)
 
+POINT = types.UniTuple(types.int64, 2)
+POINT_F = types.UniTuple(types.float64, 2)
+SCALES = (types.int64, types.float64)
+PATH = types.Array(types.uint32, 2, "C")
+
+GRIDS = tuple(types.Array(types.bool_, 2, "C", readonly=readonly) for readonly in (False, True))
+BITS = tuple(types.Array(types.uint8, 1, "C", readonly=readonly) for readonly in (False, True))
+MAZE_TYPES = GRIDS + tuple(types.Tuple((types.int64, types.int64, bits, bits)) for bits in BITS)
+
+SIGNATURES = {
+    "empty_path": [()],
+    "from_screen": [(POINT, POINT, POINT_F, scale) for scale in SCALES],
+}
+
 
 @njit(cache=True)
 def empty_path():
@@ -42,3 +59,29 @@ def distance(p1, p2):
     dy = y2 - y1
 
     return np.sqrt(dx * dx + dy * dy)
+
+
+def is_walkable(maze, x, y):
+    if isinstance(maze, tuple):
+        return packed_walkable(maze, x, y)
+    return bound_check(maze, x, y)
+
+
+def maze_shape(maze):
+    if isinstance(maze, tuple):
+        return packed_shape(maze)
+    return maze.shape
+
+
+@overload(is_walkable)
+def overload_is_walkable(maze, x, y):
+    if isinstance(maze, types.BaseTuple):
+        return lambda maze, x, y: packed_walkable(maze, x, y)
+    return lambda maze, x, y: bound_check(maze, x, y)
+
+
+@overload(maze_shape)
+def overload_maze_shape(maze):
+    if isinstance(maze, types.BaseTuple):
+        return lambda maze: packed_shape(maze)
+    return lambda maze: maze.shape
@@ -0,0 +1,58 @@
+import threading
+
+from collections import OrderedDict
+from queue import Queue, Empty
+
+
+class Worker:
+    def __init__(self):
+        self.jobs = OrderedDict()
+        self.results = Queue()
+        self.generation = 0
+        self.cond = threading.Condition()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def submit(self, key, fn, *args):
+        with self.cond:
+            self.generation += 1
+            if key is None:
+                key = ("once", self.generation)
+
+            self.jobs.pop(key, None)
+            self.jobs[key] = (self.generation, fn, args)
+            self.cond.notify()
+
+            return self.generation
+
+
+    def cancel(self, key):
+        with self.cond:
+            self.jobs.pop(key, None)
+
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.jobs:
+                    self.cond.wait()
+                key, (generation, fn, args) = self.jobs.popitem(last=False)
+
+            try:
+                result = fn(*args)
+            except Exception as e:
+                result = e
+
+            if result is not None:
+                self.results.put((key, generation, result))
+
+
+    def poll(self):
+        done = []
+        while True:
+            try:
+                done.append(self.results.get_nowait())
+            except Empty:
+                return done